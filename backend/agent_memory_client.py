@@ -1,9 +1,27 @@
 """Redis Agent Memory Server client for FastFit Radar."""
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Set, Tuple
 import httpx
+import numpy as np
+import orjson
+from cachetools import TTLCache
 import asyncio
+import html
+import logging
 import re
 from config import config
+from http_client import get_client
+from models import Product
+from semantic_cache import semantic_cache
+
+logger = logging.getLogger(__name__)
+
+_TAG_RE = re.compile(r'<[^>]+>')
+_CAMEL_RE = re.compile(r'([a-z])([A-Z])')
+_WS_RE = re.compile(r'\s+')
+
+# Parsed recent-product lists keyed by (query, limit); cleared when new products are stored
+_RECENT_PRODUCTS_QUERY = "fashion clothing products new releases"
+_RECENT_PRODUCTS_CACHE: TTLCache = TTLCache(maxsize=64, ttl=60)
 
 class AgentMemoryClient:
     """Client for Redis Agent Memory Server."""
@@ -12,37 +30,163 @@ class AgentMemoryClient:
         """Initialize Agent Memory Server client."""
         self.base_url = config.AGENT_MEMORY_SERVER_URL
         self.user_id = config.AGENT_MEMORY_USER_ID
-        self.client = httpx.AsyncClient(
-            base_url=self.base_url,
-            timeout=httpx.Timeout(30.0, connect=10.0),  # 30s total, 10s connect
-            limits=httpx.Limits(max_keepalive_connections=20, max_connections=100)
+        # Unknown until the first batch search; False once the server has no batch endpoint
+        self._batch_search_supported: Optional[bool] = None
+    
+    async def post(self, path: str, **kwargs) -> httpx.Response:
+        """POST to the memory server using the shared HTTP client."""
+        client = await get_client()
+        return await client.post(f"{self.base_url}{path}", **kwargs)
+    
+    async def post_json(self, path: str, payload: Dict[str, Any]) -> httpx.Response:
+        """POST a JSON body serialized with orjson rather than httpx's stdlib encoder."""
+        return await self.post(
+            path,
+            content=orjson.dumps(payload),
+            headers={"Content-Type": "application/json"}
         )
     
     async def search_memories(
         self, 
         query: str, 
         limit: int = 50,
-        user_id_filter: Optional[str] = None
+        user_id_filter: Optional[str] = None,
+        topics_filter: Optional[List[str]] = None,
+        offset: int = 0,
+        raise_on_error: bool = False,
+        use_cache: bool = True,
+        entities_filter: Optional[List[str]] = None,
+        memory_type_filter: Optional[str] = None
     ) -> List[Dict[str, Any]]:
-        """Search memories using semantic search."""
+        """Search memories using semantic search, optionally limited to memories with any of the given
+        topics or entities, or of one memory type.
+        
+        Errors are logged and return an empty list, unless raise_on_error is set for callers
+        that must tell "nothing stored" apart from "lookup failed". Pass use_cache=False for
+        one-off exact lookups (e.g. by product id) that the semantic cache would only slow down
+        and could answer with a near-identical but different query's results.
+        """
         try:
+            user_id = user_id_filter or self.user_id
+            limit = min(limit, 100)  # API max is 100
+            
+            # Only shared product searches are cached; user-scoped lookups must see writes immediately
+            use_cache = (
+                use_cache and user_id_filter is None and topics_filter is None
+                and entities_filter is None and memory_type_filter is None and not offset
+            )
+            if use_cache:
+                cached, query_embedding, generation = await semantic_cache.get(query, user_id, limit)
+                if cached is not None:
+                    return cached
+            
             # Build search request body
             search_request = {
                 "text": query,
-                "user_id": {"eq": user_id_filter or self.user_id},
-                "limit": min(limit, 100)  # API max is 100
+                "user_id": {"eq": user_id},
+                "limit": limit
             }
+            if topics_filter:
+                search_request["topics"] = {"any": topics_filter}
+            if entities_filter:
+                search_request["entities"] = {"any": entities_filter}
+            if memory_type_filter:
+                search_request["memory_type"] = {"eq": memory_type_filter}
+            if offset:
+                search_request["offset"] = offset
             
-            response = await self.client.post(
+            response = await self.post_json(
                 "/v1/long-term-memory/search",
-                json=search_request
+                search_request
             )
             response.raise_for_status()
             result = response.json()
-            return result.get("memories", [])
+            memories = result.get("memories", [])
+            if use_cache:
+                await semantic_cache.set(query, user_id, limit, memories, query_embedding, generation)
+            return memories
         except Exception as e:
-            print(f"Error searching memories: {e}")
+            logger.error("Error searching memories: %s", e)
+            if raise_on_error:
+                raise
+            return []
+    
+    async def search_memories_batch(
+        self,
+        queries: List[str],
+        limit: int = 1,
+        user_id_filter: Optional[str] = None,
+        concurrency: int = 8,
+        use_cache: bool = True
+    ) -> List[List[Dict[str, Any]]]:
+        """Run several searches in one request; returns one memory list per query, in order.
+        
+        Falls back to concurrent search_memories calls (at most `concurrency` at a time)
+        when the memory server has no batch search endpoint; use_cache applies to those.
+        """
+        if not queries:
             return []
+        
+        user_id = user_id_filter or self.user_id
+        limit = min(limit, 100)  # API max is 100
+        
+        if self._batch_search_supported is not False:
+            try:
+                response = await self.post_json(
+                    "/v1/long-term-memory/search/batch",
+                    {"queries": [
+                        {"text": query, "user_id": {"eq": user_id}, "limit": limit}
+                        for query in queries
+                    ]}
+                )
+                if response.status_code in (404, 405):
+                    logger.info("Memory server has no batch search endpoint, using concurrent searches")
+                    self._batch_search_supported = False
+                else:
+                    response.raise_for_status()
+                    self._batch_search_supported = True
+                    results = response.json().get("results", [])
+                    return [result.get("memories", []) for result in results]
+            except Exception as e:
+                logger.error("Error in batch memory search: %s", e)
+                return [[] for _ in queries]
+        
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def _search_one(query: str) -> List[Dict[str, Any]]:
+            async with semaphore:
+                return await self.search_memories(
+                    query=query,
+                    limit=limit,
+                    user_id_filter=user_id_filter,
+                    use_cache=use_cache
+                )
+        
+        return list(await asyncio.gather(*[_search_one(query) for query in queries]))
+    
+    async def get_product_memories(self, product_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Look up stored products by id; ids with no stored product are left out.
+        
+        Product ids never appear in the memory text, so a semantic search for them would return
+        arbitrary products. Instead each search is restricted to the exact product_id entities
+        and every result is checked against the expected memory id.
+        """
+        chunks = [product_ids[start:start + 100] for start in range(0, len(product_ids), 100)]  # API max is 100
+        results = await asyncio.gather(*[
+            self.search_memories(
+                query="product",
+                limit=len(chunk),
+                entities_filter=[f"product_id:{product_id}" for product_id in chunk]
+            )
+            for chunk in chunks
+        ])
+        
+        wanted = {f"product_{product_id}": product_id for product_id in product_ids}
+        return {
+            wanted[memory["id"]]: memory
+            for memories in results for memory in memories
+            if memory.get("id") in wanted
+        }
     
     async def store_product_memory(self, product: Dict[str, Any]) -> bool:
         """Store a product as a long-term memory."""
@@ -73,102 +217,151 @@ class AgentMemoryClient:
                 ]
             }
             
-            response = await self.client.post(
+            response = await self.post_json(
                 "/v1/long-term-memory/",
-                json={"memories": [memory_data], "deduplicate": True}
+                {"memories": [memory_data], "deduplicate": True}
             )
             response.raise_for_status()
             return True
         except Exception as e:
-            print(f"Error storing product memory {product.get('id', 'unknown')}: {e}")
+            logger.error("Error storing product memory %s: %s", product.get("id", "unknown"), e)
             return False
     
-    async def store_products_batch(self, products: List[Dict[str, Any]]) -> int:
-        """Store multiple products as memories in batch."""
+    async def store_products_batch(
+        self,
+        products: List[Dict[str, Any]],
+        concurrency: int = 10
+    ) -> List[str]:
+        """Store multiple products as memories in batch; returns the ids that were stored."""
         if not products:
-            return 0
+            return []
         
-        batch_size = 10
-        stored_count = 0
+        # Bound in-flight requests without waiting on batch boundaries
+        semaphore = asyncio.Semaphore(concurrency)
+        stored_ids = []
         
-        for i in range(0, len(products), batch_size):
-            batch = products[i:i + batch_size]
-            results = await asyncio.gather(
-                *[self.store_product_memory(product) for product in batch],
-                return_exceptions=True
-            )
-            stored_count += sum(1 for r in results if r is True)
+        async def _store_one(product: Dict[str, Any]) -> Optional[str]:
+            async with semaphore:
+                return product.get("id") if await self.store_product_memory(product) else None
         
-        return stored_count
+        tasks = [asyncio.create_task(_store_one(product)) for product in products]
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                product_id = await next_done
+                if product_id:
+                    stored_ids.append(product_id)
+            except Exception as e:
+                logger.error("Error storing product memory: %s", e)
+        
+        if stored_ids:
+            _RECENT_PRODUCTS_CACHE.clear()
+            await semantic_cache.bump_generation()
+        return stored_ids
     
-    async def retrieve_recent_products(self, limit: int = 50) -> List[Dict[str, Any]]:
+    async def _rank_by_taste_profile(self, profile: np.ndarray, candidates: List[Tuple[Product, str]]):
+        """Score (product, memory text) candidates by cosine similarity to a taste profile, best first.
+        
+        Candidates whose embedding is unavailable keep their search score and follow the scored ones.
+        """
+        # Imported here so searches that never rank by profile never load the OpenAI client
+        from embeddings import embedding_service
+        embeddings = await embedding_service.get_product_embeddings([product.id for product, _ in candidates])
+        embeddings.update(await embedding_service.embed_products({
+            product.id: text for product, text in candidates if text and product.id not in embeddings
+        }))
+        
+        for product, _ in candidates:
+            embedding = embeddings.get(product.id)
+            if embedding is not None:
+                norm = np.linalg.norm(embedding)
+                product.similarity_score = float(embedding @ profile / norm) if norm else 0.0
+        # Stable sort, so unscored candidates stay in search order
+        candidates.sort(key=lambda c: (c[0].id in embeddings, c[0].similarity_score or 0.0), reverse=True)
+    
+    def _parse_memory_to_product(
+        self,
+        memory: Dict[str, Any],
+        skip_ids: Optional[Set[str]] = None
+    ) -> Optional[Product]:
+        """Convert a product memory into a Product, or None if not a product or skipped."""
+        memory_id = memory.get("id", "")
+        if not memory_id.startswith("product_"):
+            return None
+        
+        product_id = memory_id.replace("product_", "")
+        # Check skipped ids before any text cleanup work
+        if skip_ids and product_id in skip_ids:
+            return None
+        entities = memory.get("entities", [])
+        
+        # Extract product data from entities ("key:value" strings)
+        fields = {"image_url": "", "product_url": "", "brand": "unknown"}
+        for entity in entities:
+            key, sep, value = entity.partition(":")
+            if sep and key in fields:
+                fields[key] = value
+        
+        text = memory.get("text", "")
+        # Strip HTML if present
+        if text:
+            text = _TAG_RE.sub(' ', text)
+            text = html.unescape(text)
+            # Fix concatenation issues (capital letter after lowercase)
+            text = _CAMEL_RE.sub(r'\1 \2', text)
+            # Clean up extra whitespace
+            text = _WS_RE.sub(' ', text).strip()
+        # Extract name - take first sentence or first 60 chars
+        name = text.partition(".")[0] if text else ""
+        if len(name) > 60:
+            name = name[:60].rsplit(' ', 1)[0] + "..."
+        
+        return Product(
+            id=product_id,
+            name=name,
+            description=text,
+            brand=fields["brand"],
+            image_url=fields["image_url"],
+            product_url=fields["product_url"],
+        )
+    
+    async def retrieve_recent_products(self, limit: int = 50) -> List[Product]:
         """Retrieve recent products from memory."""
         try:
+            cache_key = (_RECENT_PRODUCTS_QUERY, limit)
+            cached = _RECENT_PRODUCTS_CACHE.get(cache_key)
+            if cached is not None:
+                return list(cached)
+            
             memories = await self.search_memories(
-                query="fashion clothing products new releases",
+                query=_RECENT_PRODUCTS_QUERY,
                 limit=limit
             )
             
             products = []
             for memory in memories:
-                memory_id = memory.get("id", "")
-                if not memory_id.startswith("product_"):
-                    continue
-                
-                product_id = memory_id.replace("product_", "")
-                entities = memory.get("entities", [])
-                
-                # Extract product data from entities
-                image_url = ""
-                product_url = ""
-                brand = "unknown"
-                
-                for entity in entities:
-                    if entity.startswith("image_url:"):
-                        image_url = entity.split(":", 1)[1]
-                    elif entity.startswith("product_url:"):
-                        product_url = entity.split(":", 1)[1]
-                    elif entity.startswith("brand:"):
-                        brand = entity.split(":", 1)[1]
-                
-                text = memory.get("text", "")
-                # Strip HTML if present
-                if text:
-                    text = re.sub(r'<[^>]+>', ' ', text)
-                    text = text.replace('&nbsp;', ' ').replace('&amp;', '&').replace('&lt;', '<').replace('&gt;', '>').replace('&quot;', '"').replace('&#39;', "'")
-                    # Fix concatenation issues (capital letter after lowercase)
-                    text = re.sub(r'([a-z])([A-Z])', r'\1 \2', text)
-                    # Clean up extra whitespace
-                    text = re.sub(r'\s+', ' ', text).strip()
-                # Extract name - take first sentence or first 60 chars
-                name = text.split(".")[0] if text else ""
-                if len(name) > 60:
-                    name = name[:60].rsplit(' ', 1)[0] + "..."
-                description = text
-                
-                product = {
-                    "id": product_id,
-                    "name": name,
-                    "description": description,
-                    "brand": brand,
-                    "image_url": image_url,
-                    "product_url": product_url,
-                }
-                products.append(product)
+                product = self._parse_memory_to_product(memory)
+                if product is not None:
+                    products.append(product)
             
-            return products
+            # Empty results may come from a failed search, so don't pin them
+            if products:
+                _RECENT_PRODUCTS_CACHE[cache_key] = products
+            return list(products)
         except Exception as e:
-            print(f"Error retrieving recent products: {e}")
+            logger.error("Error retrieving recent products: %s", e)
             return []
     
     async def match_products_to_user(
         self, 
         user_email: str, 
         limit: int = 10
-    ) -> List[Dict[str, Any]]:
-        """Match products to user taste profile using semantic search."""
+    ) -> List[Product]:
+        """Match products to user taste profile using semantic search.
+        
+        Search candidates are reranked by similarity to the user's taste profile once one has been built.
+        """
         try:
-            # Get user preferences to build search query
+            # Get user preferences to build search query (cached by UserPreferences)
             from user_preferences import user_preferences
             preferences = await user_preferences.get_user_preferences(user_email)
             
@@ -182,75 +375,34 @@ class AgentMemoryClient:
             
             query = " ".join(search_terms) if search_terms else "fashion clothing products"
             
-            # Search for matching products
-            memories = await self.search_memories(
-                query=query,
-                limit=limit * 2  # Get more to filter
+            # Search for matching products and load the taste profile built from liked products
+            memories, profile = await asyncio.gather(
+                self.search_memories(
+                    query=query,
+                    limit=limit * 2  # Get more to filter
+                ),
+                user_preferences.get_taste_profile(user_email)
             )
             
             # Filter to only products and exclude disliked
             disliked_ids = set(preferences.get("disliked_product_ids", []))
-            matched_products = []
+            candidates = []
             
             for memory in memories:
-                memory_id = memory.get("id", "")
-                if not memory_id.startswith("product_"):
-                    continue
-                
-                product_id = memory_id.replace("product_", "")
-                if product_id in disliked_ids:
+                product = self._parse_memory_to_product(memory, disliked_ids)
+                if product is None:
                     continue
                 
-                # Extract product data
-                entities = memory.get("entities", [])
-                image_url = ""
-                product_url = ""
-                brand = "unknown"
-                
-                for entity in entities:
-                    if entity.startswith("image_url:"):
-                        image_url = entity.split(":", 1)[1]
-                    elif entity.startswith("product_url:"):
-                        product_url = entity.split(":", 1)[1]
-                    elif entity.startswith("brand:"):
-                        brand = entity.split(":", 1)[1]
-                
-                text = memory.get("text", "")
-                # Strip HTML if present
-                if text:
-                    text = re.sub(r'<[^>]+>', ' ', text)
-                    text = text.replace('&nbsp;', ' ').replace('&amp;', '&').replace('&lt;', '<').replace('&gt;', '>').replace('&quot;', '"').replace('&#39;', "'")
-                    # Fix concatenation issues (capital letter after lowercase)
-                    text = re.sub(r'([a-z])([A-Z])', r'\1 \2', text)
-                    # Clean up extra whitespace
-                    text = re.sub(r'\s+', ' ', text).strip()
-                # Extract name - take first sentence or first 60 chars
-                name = text.split(".")[0] if text else ""
-                if len(name) > 60:
-                    name = name[:60].rsplit(' ', 1)[0] + "..."
-                
-                product = {
-                    "id": product_id,
-                    "name": name,
-                    "description": text,
-                    "brand": brand,
-                    "image_url": image_url,
-                    "product_url": product_url,
-                    "similarity_score": memory.get("score", 0.0)
-                }
-                matched_products.append(product)
-                
-                if len(matched_products) >= limit:
-                    break
+                product.similarity_score = memory.get("score", 0.0)
+                candidates.append((product, memory.get("text", "")))
+            
+            if profile is not None and candidates:
+                await self._rank_by_taste_profile(profile, candidates)
             
-            return matched_products
+            return [product for product, _ in candidates[:limit]]
         except Exception as e:
-            print(f"Error matching products to user {user_email}: {e}")
+            logger.error("Error matching products to user %s: %s", user_email, e)
             return []
-    
-    async def close(self):
-        """Close the HTTP client."""
-        await self.client.aclose()
 
 # Global client instance
 agent_memory_client = AgentMemoryClient()
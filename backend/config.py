@@ -39,6 +39,11 @@ class Config:
     EMBEDDING_MODEL = "text-embedding-3-small"
     EMBEDDING_DIMENSION = 1536
     
+    # Search Cache Configuration
+    SEARCH_CACHE_INDEX_NAME = "fastfit_search_cache"
+    SEARCH_CACHE_TTL_SECONDS = int(os.getenv("SEARCH_CACHE_TTL_SECONDS", "600"))  # Default 10 minutes
+    SEARCH_CACHE_SIMILARITY_THRESHOLD = float(os.getenv("SEARCH_CACHE_SIMILARITY_THRESHOLD", "0.97"))
+    
     # Email Configuration
     RESEND_API_KEY = os.getenv("RESEND_API_KEY", "")
     EMAIL_FROM = os.getenv("EMAIL_FROM", "FastFit Radar <onboarding@resend.dev>")
@@ -1,37 +1,107 @@
 """OpenAI embeddings for products."""
-from openai import OpenAI
-from typing import List
+from openai import AsyncOpenAI
+from typing import Dict, List
+import asyncio
+import numpy as np
 from config import config
+from redis_connection import get_redis
+
+# Inputs per embeddings request (OpenAI allows up to 2048)
+EMBEDDING_BATCH_SIZE = 256
+# Per-input character limit
+EMBEDDING_MAX_CHARS = 8000
+
+# Float32 embedding per product id, shared by all workers; a product's text never changes once stored
+PRODUCT_EMBEDDING_KEY = "fastfit:product_embedding:{product_id}"
+PRODUCT_EMBEDDING_TTL_SECONDS = 7 * 24 * 60 * 60
 
 class EmbeddingService:
     """Service for generating embeddings."""
-    
+
     def __init__(self):
-        """Initialize OpenAI client."""
-        self.client = OpenAI(api_key=config.OPENAI_API_KEY)
-    
-    def generate_embedding(self, text: str) -> List[float]:
+        """Initialize async OpenAI client."""
+        self.aclient = AsyncOpenAI(api_key=config.OPENAI_API_KEY)
+
+    async def generate_embedding(self, text: str) -> List[float]:
         """Generate embedding for a text string."""
         try:
-            response = self.client.embeddings.create(
+            response = await self.aclient.embeddings.create(
                 model=config.EMBEDDING_MODEL,
-                input=text[:8000]  # Limit text length
+                input=text[:EMBEDDING_MAX_CHARS]  # Limit text length
             )
             return response.data[0].embedding
         except Exception as e:
             print(f"Error generating embedding: {e}")
             return []
-    
-    def generate_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings for multiple texts."""
-        embeddings = []
-        for text in texts:
-            embedding = self.generate_embedding(text)
-            if embedding:
-                embeddings.append(embedding)
+
+    async def _embed_chunk(self, chunk: List[str]) -> List[List[float]]:
+        """Embed one chunk of texts in a single API call, preserving input order."""
+        response = await self.aclient.embeddings.create(
+            model=config.EMBEDDING_MODEL,
+            input=[text[:EMBEDDING_MAX_CHARS] for text in chunk]
+        )
+        embeddings: List[List[float]] = [[] for _ in chunk]
+        for item in response.data:
+            embeddings[item.index] = item.embedding
+        return embeddings
+
+    async def generate_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings for multiple texts, requesting all chunks concurrently."""
+        chunks = [
+            texts[start:start + EMBEDDING_BATCH_SIZE]
+            for start in range(0, len(texts), EMBEDDING_BATCH_SIZE)
+        ]
+        results = await asyncio.gather(
+            *[self._embed_chunk(chunk) for chunk in chunks],
+            return_exceptions=True
+        )
+
+        embeddings: List[List[float]] = []
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, Exception):
+                print(f"Error generating embeddings for batch: {result}")
+                embeddings.extend([] for _ in chunk)
             else:
-                embeddings.append([])
+                embeddings.extend(result)
         return embeddings
 
-embedding_service = EmbeddingService()
+    async def get_product_embeddings(self, product_ids: List[str]) -> Dict[str, np.ndarray]:
+        """Return the cached embeddings of the given products; ids never embedded are left out."""
+        if not product_ids:
+            return {}
+        try:
+            redis = await get_redis()
+            blobs = await redis.mget([PRODUCT_EMBEDDING_KEY.format(product_id=pid) for pid in product_ids])
+        except Exception as e:
+            print(f"Error reading product embeddings: {e}")
+            return {}
+        return {
+            pid: np.frombuffer(blob, dtype=np.float32)
+            for pid, blob in zip(product_ids, blobs) if blob
+        }
 
+    async def embed_products(self, texts: Dict[str, str]) -> Dict[str, np.ndarray]:
+        """Embed product texts by id in one batch and cache them, so each product is embedded once."""
+        if not texts:
+            return {}
+        product_ids = list(texts)
+        results = await self.generate_embeddings_batch([texts[pid] for pid in product_ids])
+        embeddings = {
+            pid: np.asarray(embedding, dtype=np.float32)
+            for pid, embedding in zip(product_ids, results) if embedding
+        }
+        if embeddings:
+            try:
+                pipe = (await get_redis()).pipeline(transaction=False)
+                for pid, embedding in embeddings.items():
+                    pipe.set(
+                        PRODUCT_EMBEDDING_KEY.format(product_id=pid),
+                        embedding.tobytes(),
+                        ex=PRODUCT_EMBEDDING_TTL_SECONDS
+                    )
+                await pipe.execute()
+            except Exception as e:
+                print(f"Error caching product embeddings: {e}")
+        return embeddings
+
+embedding_service = EmbeddingService()
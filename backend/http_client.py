@@ -0,0 +1,21 @@
+"""Shared async HTTP client for outbound requests."""
+import httpx
+from loop_bound import LoopBoundClient
+
+_client: LoopBoundClient[httpx.AsyncClient] = LoopBoundClient(
+    lambda: httpx.AsyncClient(
+        http2=True,
+        timeout=httpx.Timeout(30.0, connect=10.0),  # 30s total, 10s connect
+        # Keep idle connections alive across polling cycles to skip reconnect/TLS setup
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=100, keepalive_expiry=75.0)
+    ),
+    is_closed=lambda client: client.is_closed
+)
+
+async def get_client() -> httpx.AsyncClient:
+    """Return the process-wide AsyncClient, creating it for the running event loop."""
+    return await _client.get()
+
+async def close_client():
+    """Close the shared client if it was created."""
+    await _client.close()
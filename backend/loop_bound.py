@@ -0,0 +1,48 @@
+"""Process-wide async clients bound to the event loop that created them."""
+from typing import Callable, Generic, Optional, TypeVar
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class LoopBoundClient(Generic[T]):
+    """Lazily created client that is replaced, and the old one closed, when the running loop changes.
+    
+    Pooled connections belong to the loop that opened them, so a client is never reused across loops.
+    The client must provide an async aclose().
+    """
+    
+    def __init__(self, factory: Callable[[], T], is_closed: Callable[[T], bool] = lambda client: False):
+        """Set the factory for new clients and how to tell a client was closed elsewhere."""
+        self._factory = factory
+        self._is_closed = is_closed
+        self._client: Optional[T] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    async def get(self) -> T:
+        """Return the client for the running loop, creating it if needed."""
+        loop = asyncio.get_running_loop()
+        if self._client is not None and self._loop is loop and not self._is_closed(self._client):
+            return self._client
+        
+        # Publish the new client before awaiting, so concurrent callers never see the old one
+        previous, self._client, self._loop = self._client, self._factory(), loop
+        if previous is not None:
+            await self._close(previous)
+        return self._client
+    
+    async def close(self):
+        """Close the client if it was created."""
+        client, self._client, self._loop = self._client, None, None
+        if client is not None:
+            await self._close(client)
+    
+    async def _close(self, client: T):
+        """Close a client, logging rather than raising on failure."""
+        try:
+            await client.aclose()
+        except Exception as e:
+            # Connections opened on a loop that is gone may not close cleanly; they are dropped anyway
+            logger.warning("Error closing %s: %s", type(client).__name__, e)
@@ -1,12 +1,17 @@
 """FastAPI main application for FastFit Radar."""
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse, RedirectResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any
 import uvicorn
 import logging
+import orjson
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from contextlib import asynccontextmanager
+from uuid import uuid4
 from config import config
 
 logger = logging.getLogger(__name__)
@@ -16,18 +21,43 @@ from agent_memory_client import agent_memory_client
 from polling_service import polling_service
 from user_preferences import user_preferences
 from email_service import email_service
+from http_client import close_client
+from redis_connection import close_redis, get_redis
+
+# Manual RSS fetch results are kept for an hour
+FETCH_JOB_TTL_SECONDS = 3600
+
+def _start_queue_logging() -> QueueListener:
+    """Route root log records through a queue so handler I/O happens off the event loop."""
+    root = logging.getLogger()
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *root.handlers, respect_handler_level=True)
+    root.handlers = [QueueHandler(log_queue)]
+    listener.start()
+    return listener
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan context manager for startup/shutdown events."""
+    log_listener = _start_queue_logging()
     # Startup: Start polling service
     await polling_service.start()
     yield
     # Shutdown: Stop polling service
     await polling_service.stop()
-    await agent_memory_client.close()
+    rss_fetcher.close()
+    await close_client()
+    await close_redis()
+    log_listener.stop()
+    logging.getLogger().handlers = list(log_listener.handlers)
 
-app = FastAPI(title="FastFit Radar API", version="1.0.0", lifespan=lifespan)
+# ORJSONResponse serializes with orjson (numpy-aware) instead of the stdlib json module
+app = FastAPI(
+    title="FastFit Radar API",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
+)
 
 # CORS middleware
 app.add_middleware(
@@ -38,6 +68,36 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Thank-you pages for email feedback clicks, encoded once; only the emoji differs
+_THANK_YOU_HTML = """
+            <!DOCTYPE html>
+            <html>
+            <head>
+                <meta charset="utf-8">
+                <meta name="viewport" content="width=device-width, initial-scale=1.0">
+                <title>Thank You!</title>
+            </head>
+            <body style="font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', Arial, sans-serif; line-height: 1.6; color: #333; max-width: 600px; margin: 50px auto; padding: 20px; text-align: center;">
+                <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 30px; border-radius: 10px 10px 0 0;">
+                    <h1 style="color: white; margin: 0; font-size: 32px;">{emoji}</h1>
+                </div>
+                <div style="background: #f9f9f9; padding: 40px; border-radius: 0 0 10px 10px;">
+                    <h2 style="color: #667eea; font-size: 24px; margin-bottom: 20px;">Thank You!</h2>
+                    <p style="font-size: 18px; margin-bottom: 30px;">
+                        Your feedback has been recorded. We'll use this to improve your future recommendations!
+                    </p>
+                    <p style="font-size: 14px; color: #666;">
+                        You can close this window now.
+                    </p>
+                </div>
+            </body>
+            </html>
+            """
+_THANK_YOU_PAGES = {
+    "good": _THANK_YOU_HTML.replace("{emoji}", "👍").encode("utf-8"),
+    "bad": _THANK_YOU_HTML.replace("{emoji}", "👎").encode("utf-8"),
+}
+
 # Request/Response models
 class SubscribeRequest(BaseModel):
     email: str
@@ -62,7 +122,7 @@ async def get_polling_status():
     """Get polling service status."""
     return {
         "success": True,
-        "status": polling_service.get_status()
+        "status": await polling_service.get_status()
     }
 
 # User Subscription Endpoints
@@ -70,7 +130,7 @@ async def get_polling_status():
 async def subscribe(request: SubscribeRequest):
     """Subscribe user with email and notification preferences."""
     try:
-        prefs = await user_preferences.get_user_preferences(request.email)
+        prefs = await user_preferences.get_user_preferences(request.email, fresh=True)
         prefs["notification_frequency"] = request.notification_frequency
         success = await user_preferences.store_user_preferences(request.email, prefs)
         
@@ -150,31 +210,7 @@ async def submit_feedback_from_email(
         
         if success:
             # Return a simple HTML thank you page
-            thank_you_html = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <meta charset="utf-8">
-                <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                <title>Thank You!</title>
-            </head>
-            <body style="font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', Arial, sans-serif; line-height: 1.6; color: #333; max-width: 600px; margin: 50px auto; padding: 20px; text-align: center;">
-                <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 30px; border-radius: 10px 10px 0 0;">
-                    <h1 style="color: white; margin: 0; font-size: 32px;">{'👍' if feedback == 'good' else '👎'}</h1>
-                </div>
-                <div style="background: #f9f9f9; padding: 40px; border-radius: 0 0 10px 10px;">
-                    <h2 style="color: #667eea; font-size: 24px; margin-bottom: 20px;">Thank You!</h2>
-                    <p style="font-size: 18px; margin-bottom: 30px;">
-                        Your feedback has been recorded. We'll use this to improve your future recommendations!
-                    </p>
-                    <p style="font-size: 14px; color: #666;">
-                        You can close this window now.
-                    </p>
-                </div>
-            </body>
-            </html>
-            """
-            return HTMLResponse(content=thank_you_html)
+            return HTMLResponse(content=_THANK_YOU_PAGES[feedback])
         else:
             raise HTTPException(status_code=500, detail="Failed to record feedback")
     except Exception as e:
@@ -182,26 +218,60 @@ async def submit_feedback_from_email(
         raise HTTPException(status_code=500, detail=str(e))
 
 # Product Endpoints
+def _fetch_job_key(job_id: str) -> str:
+    return f"fastfit:job:{job_id}"
+
+async def _run_fetch_job(job_id: str):
+    """Fetch all RSS feeds and store the outcome under the job key."""
+    try:
+        products = await rss_fetcher.fetch_all_feeds()
+        result = {"status": "completed", "products": products, "count": len(products)}
+    except Exception as e:
+        logger.error(f"RSS fetch job {job_id} failed: {e}", exc_info=True)
+        result = {"status": "failed", "error": str(e)}
+    redis = await get_redis()
+    await redis.set(_fetch_job_key(job_id), orjson.dumps(result), ex=FETCH_JOB_TTL_SECONDS)
+
 @app.post("/api/fetch-rss")
-async def fetch_rss():
-    """Fetch products from RSS feeds manually."""
+async def fetch_rss(background_tasks: BackgroundTasks):
+    """Start a manual RSS fetch in the background and return its job id."""
     try:
-        products = rss_fetcher.fetch_all_feeds()
+        job_id = uuid4().hex
+        redis = await get_redis()
+        await redis.set(_fetch_job_key(job_id), orjson.dumps({"status": "running"}), ex=FETCH_JOB_TTL_SECONDS)
+        background_tasks.add_task(_run_fetch_job, job_id)
         return {
             "success": True,
-            "products": products,
-            "count": len(products)
+            "job_id": job_id,
+            "status": "running"
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/fetch-rss/{job_id}")
+async def get_fetch_rss_job(job_id: str):
+    """Get the status and products of a manual RSS fetch job."""
+    try:
+        redis = await get_redis()
+        job_data = await redis.get(_fetch_job_key(job_id))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    if job_data is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return {
+        "success": True,
+        "job_id": job_id,
+        **orjson.loads(job_data)
+    }
+
 @app.post("/api/store-products")
 async def store_products(products: List[Dict[str, Any]]):
     """Store products in Agent Memory Server manually."""
-    stored_count = await agent_memory_client.store_products_batch(products)
+    stored_ids = await agent_memory_client.store_products_batch(products)
     return {
         "success": True,
-        "stored": stored_count,
+        "stored": len(stored_ids),
         "total": len(products)
     }
 
@@ -245,4 +315,15 @@ async def match_products_for_user(email: str, limit: int = 10):
         raise HTTPException(status_code=500, detail=str(e))
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Workers need an import string; WEB_CONCURRENCY overrides the 2n+1 default
+    workers = int(os.getenv("WEB_CONCURRENCY", (os.cpu_count() or 1) * 2 + 1))
+    # Exported so worker processes (e.g. the polling service) know they are not alone
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=workers
+    )
@@ -0,0 +1,14 @@
+"""Data models shared across FastFit Radar services."""
+from dataclasses import dataclass
+from typing import Optional
+
+@dataclass(slots=True)
+class Product:
+    """Product parsed from a memory record."""
+    id: str
+    name: str
+    description: str
+    brand: str
+    image_url: str
+    product_url: str
+    similarity_score: Optional[float] = None
@@ -1,16 +1,44 @@
 """Background polling service for continuous RSS feed polling."""
 import asyncio
 from typing import List, Dict, Any
-from datetime import datetime
 import logging
+import os
+import time
+import uuid
 
-from rss_fetcher import rss_fetcher
+from rss_fetcher import rss_fetcher, now_iso
 from agent_memory_client import agent_memory_client
+from redis_connection import get_redis
 from config import config
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# How long a product id is remembered after it was stored. An id still in a feed after that
+# (and after a restart clears rss_fetcher's in-process dedup) is stored again, which only
+# upserts the same memory.
+SEEN_PRODUCTS_TTL_SECONDS = 7 * 24 * 60 * 60
+
+# Only the worker holding this lock polls; it expires if the leader dies without releasing it
+POLL_LEADER_KEY = "fastfit:poll:leader"
+POLL_LEADER_TTL_SECONDS = 60
+# How often non-leaders check whether the lock is free
+POLL_FOLLOWER_RETRY_SECONDS = 5
+# Renew / release the lock only if this worker still holds it, atomically, so a worker whose
+# lock expired can never extend or delete the lock another worker has taken since
+_RENEW_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
 class PollingService:
     """Background service that continuously polls RSS feeds for new products."""
     
@@ -18,7 +46,15 @@ class PollingService:
         """Initialize polling service."""
         self.is_running = False
         self.last_poll_time = None
-        self.processed_product_ids = set()  # Track processed products to avoid duplicates
+        # Stored product ids live in a Redis sorted set scored by store time,
+        # shared across workers and trimmed after SEEN_PRODUCTS_TTL_SECONDS
+        self.seen_key = "fastfit:seen"
+        # Identifies this worker as the holder of the polling leader lock
+        self.instance_id = uuid.uuid4().hex
+        self.is_leader = False
+        # uvicorn's --workers defaults to WEB_CONCURRENCY, so unset means this is the only worker
+        self.single_worker = int(os.getenv("WEB_CONCURRENCY", "1")) <= 1
+        self._lock_unavailable = False
         
     async def start(self):
         """Start the polling service."""
@@ -37,44 +73,150 @@ class PollingService:
         """Stop the polling service."""
         self.is_running = False
         logger.info("Stopping polling service...")
+        await self._release_leadership()
     
     async def _poll_loop(self):
         """Main polling loop for fetching and storing products from RSS feeds."""
         while self.is_running:
+            if not await self._acquire_leadership():
+                await asyncio.sleep(POLL_FOLLOWER_RETRY_SECONDS)
+                continue
+            
+            # A poll can outlast the lock TTL (slow feeds, hundreds of memory writes), so keep
+            # renewing it meanwhile; otherwise another worker could start polling alongside
+            renewal = asyncio.create_task(self._renew_leadership())
             try:
                 logger.info("Fetching products from RSS feeds...")
-                products = rss_fetcher.fetch_all_feeds()
+                products = await rss_fetcher.fetch_all_feeds()
                 
                 # Filter out already processed products
-                new_products = [p for p in products if p.get("id") not in self.processed_product_ids]
+                new_products = await self._filter_new_products(products)
                 
                 if new_products:
                     logger.info(f"Found {len(new_products)} new products out of {len(products)} total")
                     
-                    # Store products in Redis Memory
-                    stored_count = await agent_memory_client.store_products_batch(new_products)
-                    logger.info(f"Stored {stored_count} products in Redis Memory")
+                    # Store products in Redis Memory; only stored ones count as seen
+                    stored_ids = await agent_memory_client.store_products_batch(new_products)
+                    logger.info(f"Stored {len(stored_ids)} products in Redis Memory")
+                    await self._mark_seen(stored_ids)
                     
-                    # Track processed products
-                    for product in new_products:
-                        self.processed_product_ids.add(product.get("id"))
+                    stored = set(stored_ids)
+                    failed = [p for p in new_products if p.get("id") not in stored]
+                    if failed:
+                        logger.warning(f"Failed to store {len(failed)} products, retrying them next poll")
+                        await rss_fetcher.forget(failed)
                 else:
                     logger.info("No new products found")
                 
-                self.last_poll_time = datetime.now()
+                self.last_poll_time = now_iso()
                 
             except Exception as e:
                 logger.error(f"Error in polling loop: {e}", exc_info=True)
+            finally:
+                renewal.cancel()
             
-            # Wait for next polling interval
-            await asyncio.sleep(config.RSS_POLLING_INTERVAL_SECONDS)
+            # Wait for next polling interval, holding on to the leader lock meanwhile
+            await self._sleep_as_leader(config.RSS_POLLING_INTERVAL_SECONDS)
+    
+    async def _acquire_leadership(self) -> bool:
+        """Take or renew the polling leader lock; return whether this worker holds it."""
+        was_leader = self.is_leader
+        try:
+            redis = await get_redis()
+            if await redis.set(POLL_LEADER_KEY, self.instance_id, nx=True, ex=POLL_LEADER_TTL_SECONDS):
+                self.is_leader = True
+            else:
+                self.is_leader = bool(await redis.eval(
+                    _RENEW_LOCK_SCRIPT, 1, POLL_LEADER_KEY, self.instance_id, POLL_LEADER_TTL_SECONDS
+                ))
+            if self._lock_unavailable:
+                logger.info("Polling leader lock reachable again")
+                self._lock_unavailable = False
+        except Exception as e:
+            # Without the lock a lone worker can safely poll; several workers must not all poll
+            if not self._lock_unavailable:
+                action = "polling without it (single worker)" if self.single_worker else "not polling until it is reachable"
+                logger.error(f"Polling leader lock unavailable, {action}: {e}")
+                self._lock_unavailable = True
+            self.is_leader = self.single_worker
+        
+        if self.is_leader != was_leader:
+            logger.info(f"Polling leadership {'acquired' if self.is_leader else 'lost'} by {self.instance_id}")
+        return self.is_leader
+    
+    async def _renew_leadership(self):
+        """Renew the leader lock every third of its TTL until cancelled or lost."""
+        while True:
+            await asyncio.sleep(POLL_LEADER_TTL_SECONDS / 3)
+            if not await self._acquire_leadership():
+                logger.warning("Polling leader lock lost during a poll")
+                return
+    
+    async def _sleep_as_leader(self, seconds: float):
+        """Sleep, renewing the leader lock often enough that it cannot expire meanwhile."""
+        deadline = time.monotonic() + seconds
+        while self.is_running:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(min(remaining, POLL_LEADER_TTL_SECONDS / 3))
+            if not await self._acquire_leadership():
+                return
     
-    def get_status(self) -> Dict[str, Any]:
+    async def _release_leadership(self):
+        """Drop the leader lock if held so another worker can take over without waiting for expiry."""
+        if not self.is_leader:
+            return
+        self.is_leader = False
+        try:
+            redis = await get_redis()
+            await redis.eval(_RELEASE_LOCK_SCRIPT, 1, POLL_LEADER_KEY, self.instance_id)
+        except Exception as e:
+            logger.error(f"Error releasing polling leader lock: {e}")
+    
+    async def _filter_new_products(self, products: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Return only products not stored before, one per id."""
+        # The same product can appear in several feeds
+        by_id = {product.get("id"): product for product in products}
+        if not by_id:
+            return []
+        
+        try:
+            redis = await get_redis()
+            scores = await redis.zmscore(self.seen_key, list(by_id))
+        except Exception as e:
+            # rss_fetcher already skips products this process has seen, so that is the fallback
+            logger.warning(f"Seen-product set unavailable, relying on in-process dedup: {e}")
+            return list(by_id.values())
+        
+        return [product for product, score in zip(by_id.values(), scores) if score is None]
+    
+    async def _mark_seen(self, product_ids: List[str]):
+        """Record stored product ids and trim those stored more than SEEN_PRODUCTS_TTL_SECONDS ago."""
+        now = time.time()
+        try:
+            redis = await get_redis()
+            pipe = redis.pipeline(transaction=False)
+            if product_ids:
+                pipe.zadd(self.seen_key, {product_id: now for product_id in product_ids})
+            pipe.zremrangebyscore(self.seen_key, 0, now - SEEN_PRODUCTS_TTL_SECONDS)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Error recording stored product ids: {e}")
+    
+    async def get_status(self) -> Dict[str, Any]:
         """Get current polling service status."""
+        try:
+            processed_count = await (await get_redis()).zcard(self.seen_key)
+        except Exception as e:
+            logger.error(f"Error reading processed product count: {e}")
+            processed_count = None
+        
         return {
             "is_running": self.is_running,
-            "last_poll_time": self.last_poll_time.isoformat() if self.last_poll_time else None,
-            "processed_products_count": len(self.processed_product_ids),
+            "is_leader": self.is_leader,
+            "last_poll_time": self.last_poll_time,
+            "processed_products_count": processed_count,
             "polling_interval_seconds": config.RSS_POLLING_INTERVAL_SECONDS
         }
 
@@ -4,9 +4,13 @@ from redisvl import RedisVL
 from redisvl.index import SearchIndex
 from redisvl.schema import IndexSchema
 from typing import List, Dict, Any, Optional
-import json
+import numpy as np
+import time
 from config import config
 
+# Post hash fields returned to callers
+POST_TEXT_FIELDS = ["id", "text", "subreddit", "score"]
+
 class RedisClient:
     """Redis client wrapper for FastFit Radar."""
     
@@ -22,7 +26,20 @@ class RedisClient:
             password=config.REDIS_PASSWORD if config.REDIS_PASSWORD else None,
             decode_responses=False  # Keep binary for vector storage
         )
+        # Decoding client for ids and metadata; the binary client stays for embeddings
+        self.text_client = redis.Redis(
+            host=config.REDIS_HOST,
+            port=config.REDIS_PORT,
+            password=config.REDIS_PASSWORD if config.REDIS_PASSWORD else None,
+            decode_responses=True
+        )
         self.rvl = RedisVL(redis_url=redis_url)
+        # Normalized embedding matrix for the in-process similarity fallback, rebuilt after writes
+        self._matrix: Optional[np.ndarray] = None
+        self._ids: List[str] = []
+        self._dirty = True
+        # Connected RedisVL index, or None when falling back to plain Redis storage
+        self.index: Optional[SearchIndex] = None
         self._ensure_index()
     
     def _ensure_index(self):
@@ -55,6 +72,7 @@ class RedisClient:
                     "attrs": {
                         "dims": config.EMBEDDING_DIMENSION,
                         "algorithm": "HNSW",
+                        "datatype": "FLOAT32",
                         "distance_metric": "COSINE"
                     }
                 }
@@ -69,88 +87,125 @@ class RedisClient:
                 print(f"Created vector index: {config.VECTOR_INDEX_NAME}")
             else:
                 print(f"Vector index exists: {config.VECTOR_INDEX_NAME}")
+            self.index = index
         except Exception as e:
             print(f"Index creation/check error: {e}")
             # Fallback to simple Redis storage if RedisVL fails
             print("Falling back to simple Redis storage")
     
-    def store_post(self, post: Dict[str, Any]) -> bool:
-        """Store a Reddit post with embedding in Redis."""
+    def _queue_post_writes(self, pipe, post: Dict[str, Any], timestamp: int):
+        """Queue the hash, embedding and recency-index writes for one post on a pipeline."""
+        key = f"{config.VECTOR_INDEX_NAME}:{post['id']}"
+        
+        # Store as hash for simple retrieval
+        pipe.hset(key, mapping={
+            "id": post["id"],
+            "text": post["text"],
+            "subreddit": post["subreddit"],
+            "score": str(post["score"]),
+        })
+        
+        # Store embedding separately for vector search
+        embedding_bytes = np.asarray(post["embedding"], dtype=np.float32).tobytes()
+        pipe.set(f"{key}:embedding", embedding_bytes)
+        
+        # Track ingest time so recent posts can be listed without scanning keys
+        pipe.zadd(self._posts_index_key(), {post["id"]: timestamp})
+    
+    def _add_to_vector_index(self, posts: List[Dict[str, Any]]):
+        """Bulk-load posts into the RedisVL index in one call; failures are non-critical."""
+        if self.index is None:
+            return
         try:
-            key = f"{config.VECTOR_INDEX_NAME}:{post['id']}"
-            
-            # Store as hash for simple retrieval
-            self.redis_client.hset(key, mapping={
-                "id": post["id"],
-                "text": post["text"],
-                "subreddit": post["subreddit"],
-                "score": str(post["score"]),
-            })
-            
-            # Store embedding separately for vector search
-            embedding_key = f"{key}:embedding"
-            embedding_bytes = json.dumps(post["embedding"]).encode('utf-8')
-            self.redis_client.set(embedding_key, embedding_bytes)
-            
-            # Try to use RedisVL for vector storage
-            try:
-                index = SearchIndex.from_dict({
-                    "index": {"name": config.VECTOR_INDEX_NAME},
-                    "fields": [{"name": "embedding", "type": "vector", "attrs": {
-                        "dims": config.EMBEDDING_DIMENSION,
-                        "algorithm": "HNSW",
-                        "distance_metric": "COSINE"
-                    }}]
-                })
-                index.connect(self.rvl)
-                
-                # Store document with vector
-                doc = {
+            # Store documents with vectors
+            docs = [
+                {
                     "id": post["id"],
                     "text": post["text"],
                     "subreddit": post["subreddit"],
                     "score": post["score"],
-                    "embedding": post["embedding"]
+                    "embedding": np.asarray(post["embedding"], dtype=np.float32).tobytes()
                 }
-                index.add([doc])
-            except Exception as e:
-                # If RedisVL fails, we still have the data in Redis
-                print(f"RedisVL storage failed (non-critical): {e}")
+                for post in posts
+            ]
+            self.index.load(docs, keys=[f"{config.VECTOR_INDEX_NAME}:{post['id']}" for post in posts])
+        except Exception as e:
+            # If RedisVL fails, we still have the data in Redis
+            print(f"RedisVL storage failed (non-critical): {e}")
+    
+    def store_post(self, post: Dict[str, Any]) -> bool:
+        """Store a Reddit post with embedding in Redis."""
+        try:
+            # One round trip for all writes of this post
+            pipe = self.redis_client.pipeline(transaction=False)
+            self._queue_post_writes(pipe, post, int(time.time()))
+            pipe.execute()
+            self._dirty = True
+            
+            # Try to use RedisVL for vector storage
+            self._add_to_vector_index([post])
             
             return True
         except Exception as e:
             print(f"Error storing post {post['id']}: {e}")
             return False
     
+    def store_posts_batch(self, posts: List[Dict[str, Any]]) -> int:
+        """Store multiple posts with a single pipelined round trip."""
+        if not posts:
+            return 0
+        
+        try:
+            timestamp = int(time.time())
+            pipe = self.redis_client.pipeline(transaction=False)
+            for post in posts:
+                self._queue_post_writes(pipe, post, timestamp)
+            pipe.execute()
+            self._dirty = True
+            
+            self._add_to_vector_index(posts)
+            
+            return len(posts)
+        except Exception as e:
+            print(f"Error storing batch of {len(posts)} posts: {e}")
+            return 0
+    
+    def _posts_index_key(self) -> str:
+        """Sorted set of post ids scored by ingest timestamp."""
+        return f"{config.VECTOR_INDEX_NAME}:index"
+    
+    def _fetch_post_metadata(self, post_keys: List[str]) -> List[Dict[str, str]]:
+        """Read the text fields of each post hash in one round trip (empty dict if missing)."""
+        # HMGET only the text fields: the hash also holds the binary vector written by RedisVL
+        pipe = self.text_client.pipeline(transaction=False)
+        for key in post_keys:
+            pipe.hmget(key, POST_TEXT_FIELDS)
+        return [
+            {field: value for field, value in zip(POST_TEXT_FIELDS, values) if value is not None}
+            for values in pipe.execute()
+        ]
+    
     def retrieve_posts(self, limit: int = 50) -> List[Dict[str, Any]]:
         """Retrieve recent posts from Redis."""
         try:
-            keys = self.redis_client.keys(f"{config.VECTOR_INDEX_NAME}:*")
-            # Filter out embedding keys
-            post_keys = []
-            for k in keys:
-                k_str = k.decode() if isinstance(k, bytes) else k
-                if not k_str.endswith(':embedding'):
-                    post_keys.append(k_str)
+            post_ids = self.text_client.zrevrange(self._posts_index_key(), 0, limit - 1)
+            post_keys = [f"{config.VECTOR_INDEX_NAME}:{i}" for i in post_ids]
+            if not post_keys:
+                return []
+            
+            metadata = self._fetch_post_metadata(post_keys)
+            embeddings = self.redis_client.mget([f"{key}:embedding" for key in post_keys])
             
             posts = []
-            for key in post_keys[:limit]:
-                data = self.redis_client.hgetall(key)
+            for data, embedding_data in zip(metadata, embeddings):
                 if data:
-                    post = {}
-                    for k, v in data.items():
-                        k_str = k.decode() if isinstance(k, bytes) else k
-                        v_str = v.decode() if isinstance(v, bytes) else v
-                        post[k_str] = v_str
+                    post = dict(data)
                     
                     # Get embedding
-                    embedding_key = f"{key}:embedding"
-                    embedding_data = self.redis_client.get(embedding_key)
                     if embedding_data:
-                        embedding_str = embedding_data.decode('utf-8') if isinstance(embedding_data, bytes) else embedding_data
-                        post["embedding"] = json.loads(embedding_str)
+                        post["embedding"] = np.frombuffer(embedding_data, dtype=np.float32)
                     else:
-                        post["embedding"] = []
+                        post["embedding"] = np.empty(0, dtype=np.float32)
                     
                     post["score"] = int(post.get("score", 0))
                     posts.append(post)
@@ -160,25 +215,76 @@ class RedisClient:
             print(f"Error retrieving posts: {e}")
             return []
     
+    def _load_embedding_matrix(self):
+        """Load all stored embeddings into one L2-normalized float32 matrix."""
+        post_ids = self.text_client.zrange(self._posts_index_key(), 0, -1)
+        embedding_keys = [f"{config.VECTOR_INDEX_NAME}:{i}:embedding" for i in post_ids]
+        raw = self.redis_client.mget(embedding_keys) if embedding_keys else []
+        
+        ids = []
+        rows = []
+        for post_id, data in zip(post_ids, raw):
+            if data:
+                vector = np.frombuffer(data, dtype=np.float32)
+                if vector.shape[0] == config.EMBEDDING_DIMENSION:
+                    ids.append(post_id)
+                    rows.append(vector)
+        
+        if rows:
+            matrix = np.vstack(rows)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix /= norms
+        else:
+            matrix = np.empty((0, config.EMBEDDING_DIMENSION), dtype=np.float32)
+        
+        self._matrix = matrix
+        self._ids = ids
+        self._dirty = False
+    
+    def _search_similar_local(self, query_embedding: List[float], limit: int) -> List[Dict[str, Any]]:
+        """Cosine similarity over all stored embeddings with a single matrix-vector product."""
+        if self._dirty or self._matrix is None:
+            self._load_embedding_matrix()
+        if not self._ids or limit <= 0:
+            return []
+        
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query_norm = np.linalg.norm(query)
+        if query_norm == 0:
+            return []
+        scores = self._matrix @ (query / query_norm)
+        
+        if limit < len(scores):
+            top = np.argpartition(-scores, limit)[:limit]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        
+        metadata = self._fetch_post_metadata([f"{config.VECTOR_INDEX_NAME}:{self._ids[i]}" for i in top])
+        
+        results = []
+        for i, data in zip(top, metadata):
+            result = dict(data)
+            # Same convention as RedisVL: cosine distance = 1 - similarity
+            result["vector_distance"] = float(1.0 - scores[i])
+            results.append(result)
+        return results
+    
     def search_similar(self, query_embedding: List[float], limit: int = 10) -> List[Dict[str, Any]]:
         """Search for similar posts using vector similarity."""
+        if self.index is not None:
+            try:
+                return self.index.query(
+                    vector=query_embedding,
+                    return_fields=POST_TEXT_FIELDS,
+                    limit=limit
+                )
+            except Exception as e:
+                print(f"RedisVL similarity search failed, using local fallback: {e}")
+        
         try:
-            index = SearchIndex.from_dict({
-                "index": {"name": config.VECTOR_INDEX_NAME},
-                "fields": [{"name": "embedding", "type": "vector", "attrs": {
-                    "dims": config.EMBEDDING_DIMENSION,
-                    "algorithm": "HNSW",
-                    "distance_metric": "COSINE"
-                }}]
-            })
-            index.connect(self.rvl)
-            
-            results = index.query(
-                vector=query_embedding,
-                return_fields=["id", "text", "subreddit", "score"],
-                limit=limit
-            )
-            return results
+            return self._search_similar_local(query_embedding, limit)
         except Exception as e:
             print(f"Error in similarity search: {e}")
             return []
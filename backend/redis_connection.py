@@ -0,0 +1,21 @@
+"""Shared async Redis connection."""
+import redis.asyncio as redis
+from config import config
+from loop_bound import LoopBoundClient
+
+_redis: LoopBoundClient[redis.Redis] = LoopBoundClient(
+    lambda: redis.Redis(
+        host=config.REDIS_HOST,
+        port=config.REDIS_PORT,
+        password=config.REDIS_PASSWORD if config.REDIS_PASSWORD else None,
+        decode_responses=False  # Keep binary for vector storage
+    )
+)
+
+async def get_redis() -> redis.Redis:
+    """Return the process-wide async Redis client, creating it for the running event loop."""
+    return await _redis.get()
+
+async def close_redis():
+    """Close the shared Redis client if it was created."""
+    await _redis.close()
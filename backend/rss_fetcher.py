@@ -1,35 +1,120 @@
 """RSS feed fetcher for clothing brand new releases."""
-from typing import List, Dict, Any
-import httpx
+from typing import List, Dict, Any, Optional
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import feedparser
+import functools
+import xxhash
 from datetime import datetime
-import hashlib
+import html
 import re
+import time
 from config import config
+from http_client import get_client
+from redis_connection import get_redis
+
+_TAG_RE = re.compile(r'<[^>]+>')
+_WS_RE = re.compile(r'\s+')
+_IMG_RE = re.compile(r'<img[^>]+src=["\']([^"\']+)["\']')
+
+# Redis hashes of feed URL -> last ETag / Last-Modified response header
+FEED_ETAG_KEY = "fastfit:feed:etag"
+FEED_LAST_MODIFIED_KEY = "fastfit:feed:last_modified"
+
+# [unix second, ISO string] for now_iso(), refreshed at most once per second
+_NOW_CACHE: List[Any] = [0, ""]
+
+def now_iso() -> str:
+    """Current UTC time as a naive ISO string, recomputed at most once per second."""
+    t = int(time.time())
+    if t != _NOW_CACHE[0]:
+        _NOW_CACHE[:] = [t, time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(t))]
+    return _NOW_CACHE[1]
+
+# Upper bound on remembered product ids; the least recently seen are evicted first
+MAX_SEEN_PRODUCTS = 10000
+
+# Brand keywords matched case-insensitively in one regex scan, mapped to display names.
+# Listed in priority order: when several appear, the first listed wins, wherever it occurs.
+_FEED_BRANDS = {"adidas": "Adidas", "hypebeast": "HYPEBEAST", "luxury": "Luxury Brands"}
+_TITLE_BRANDS = {"adidas": "Adidas", "nike": "Nike", "zara": "Zara"}
+_FEED_BRAND_RE = re.compile("|".join(_FEED_BRANDS), re.IGNORECASE)
+_TITLE_BRAND_RE = re.compile("|".join(_TITLE_BRANDS), re.IGNORECASE)
+
+def _match_brand(brand_re: re.Pattern, brands: Dict[str, str], text: str) -> Optional[str]:
+    """Display name of the highest-priority brand keyword in text, or None if there is none."""
+    found = {match.lower() for match in brand_re.findall(text)}
+    if not found:
+        return None
+    return next(name for keyword, name in brands.items() if keyword in found)
+
+def _brand_from_feed_url(feed_url: str) -> Optional[str]:
+    """Brand implied by a feed URL, or None if the URL names no known brand."""
+    return _match_brand(_FEED_BRAND_RE, _FEED_BRANDS, feed_url)
+
+# Configured feeds never change at runtime, so resolve their brands once
+_BRAND_BY_FEED: Dict[str, Optional[str]] = {url: _brand_from_feed_url(url) for url in config.RSS_FEEDS}
 
 class RSSFetcher:
     """Fetches products from fashion brand RSS feeds."""
     
     def __init__(self):
         """Initialize RSS fetcher."""
-        self.client = httpx.Client(timeout=30.0)
-        self.processed_ids = set()  # Track processed products to avoid duplicates
+        # Processed products by id in least-recently-seen order, bounded to MAX_SEEN_PRODUCTS
+        self._seen: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        # Per-feed HTTP cache validators for conditional GETs, persisted in Redis
+        self._etag: Dict[str, str] = {}
+        self._last_modified: Dict[str, str] = {}
+        self._validators_loaded = False
+        # Feed parsing gets its own threads instead of sharing the loop's default executor
+        # (getaddrinfo, to_thread); created on first use
+        self._parse_executor: Optional[ThreadPoolExecutor] = None
+    
+    def close(self):
+        """Shut down the feed parsing threads; a later fetch starts new ones."""
+        if self._parse_executor is not None:
+            self._parse_executor.shutdown(wait=False)
+            self._parse_executor = None
     
-    def fetch_feed(self, feed_url: str) -> List[Dict[str, Any]]:
+    async def fetch_feed(self, feed_url: str) -> List[Dict[str, Any]]:
         """Fetch and parse a single RSS feed."""
         products = []
         try:
-            response = self.client.get(feed_url)
+            client = await get_client()
+            response = await client.get(feed_url, headers=self._conditional_headers(feed_url))
+            # Feed unchanged since the last fetch: nothing to parse
+            if response.status_code == 304:
+                return products
             response.raise_for_status()
             
-            feed = feedparser.parse(response.text)
+            # Parsing is CPU-bound; run it in the parse thread pool to keep the event loop free.
+            # Raw bytes let feedparser detect the encoding itself (Content-Type charset included)
+            # instead of httpx decoding first. With sanitize_html off, HTML titles and summaries
+            # keep their raw markup, so both go through _strip_html before use.
+            if self._parse_executor is None:
+                self._parse_executor = ThreadPoolExecutor(
+                    max_workers=max(1, min(32, len(config.RSS_FEEDS) * 2)),
+                    thread_name_prefix="feed-parse"
+                )
+            feed = await asyncio.get_running_loop().run_in_executor(
+                self._parse_executor,
+                functools.partial(
+                    feedparser.parse,
+                    response.content,
+                    response_headers={"content-type": response.headers.get("content-type", "")},
+                    resolve_relative_uris=False,
+                    sanitize_html=False
+                )
+            )
             
             for entry in feed.entries:
                 # Generate unique ID from entry link or title
                 product_id = self._generate_id(entry)
                 
-                # Skip if already processed
-                if product_id in self.processed_ids:
+                # Skip if already processed, keeping ids still present in feeds from being evicted
+                if product_id in self._seen:
+                    self._seen.move_to_end(product_id)
                     continue
                 
                 # Extract product information
@@ -38,7 +123,7 @@ class RSSFetcher:
                 
                 product = {
                     "id": product_id,
-                    "name": entry.get("title", ""),
+                    "name": self._strip_html(entry.get("title", "")),
                     "description": cleaned_description,
                     "brand": self._extract_brand_from_feed(feed_url, entry),
                     "product_url": entry.get("link", ""),
@@ -48,19 +133,103 @@ class RSSFetcher:
                 }
                 
                 products.append(product)
-                self.processed_ids.add(product_id)
+                self._seen[product_id] = product
+                if len(self._seen) > MAX_SEEN_PRODUCTS:
+                    self._seen.popitem(last=False)
+            
+            # Only remember validators once the entries were processed, so a failed parse is retried
+            await self._store_validators(feed_url, response.headers)
         
         except Exception as e:
             print(f"Error fetching RSS feed {feed_url}: {e}")
         
         return products
     
-    def fetch_all_feeds(self) -> List[Dict[str, Any]]:
-        """Fetch products from all configured RSS feeds."""
-        all_products = []
+    async def forget(self, products: List[Dict[str, Any]]):
+        """Forget products that could not be stored, so the next fetch returns them again."""
+        feeds = set()
+        for product in products:
+            self._seen.pop(product["id"], None)
+            feeds.add(product["source_feed"])
+        
+        # Their feeds may not change before then, so drop the validators to re-parse them in full
+        for feed_url in feeds:
+            self._etag.pop(feed_url, None)
+            self._last_modified.pop(feed_url, None)
+        try:
+            redis = await get_redis()
+            pipe = redis.pipeline(transaction=False)
+            pipe.hdel(FEED_ETAG_KEY, *feeds)
+            pipe.hdel(FEED_LAST_MODIFIED_KEY, *feeds)
+            await pipe.execute()
+        except Exception as e:
+            print(f"Error dropping feed cache validators: {e}")
+    
+    async def _load_validators(self):
+        """Load the persisted cache validators once; a failed load is retried on the next fetch."""
+        if self._validators_loaded:
+            return
+        try:
+            redis = await get_redis()
+            etags, last_modified = await asyncio.gather(
+                redis.hgetall(FEED_ETAG_KEY),
+                redis.hgetall(FEED_LAST_MODIFIED_KEY)
+            )
+        except Exception as e:
+            print(f"Error loading feed cache validators: {e}")
+            return
+        # Validators stored by this process since startup are newer than the persisted ones
+        self._etag = {**{k.decode(): v.decode() for k, v in etags.items()}, **self._etag}
+        self._last_modified = {**{k.decode(): v.decode() for k, v in last_modified.items()}, **self._last_modified}
+        self._validators_loaded = True
+    
+    def _conditional_headers(self, feed_url: str) -> Dict[str, str]:
+        """Build If-None-Match / If-Modified-Since headers from the last response for this feed."""
+        headers = {}
+        if feed_url in self._etag:
+            headers["If-None-Match"] = self._etag[feed_url]
+        if feed_url in self._last_modified:
+            headers["If-Modified-Since"] = self._last_modified[feed_url]
+        return headers
+    
+    async def _store_validators(self, feed_url: str, response_headers):
+        """Remember ETag / Last-Modified from a successful feed response."""
+        etag = response_headers.get("ETag")
+        last_modified = response_headers.get("Last-Modified")
+        if etag == self._etag.get(feed_url) and last_modified == self._last_modified.get(feed_url):
+            return
         
-        for feed_url in config.RSS_FEEDS:
-            products = self.fetch_feed(feed_url)
+        try:
+            redis = await get_redis()
+            pipe = redis.pipeline(transaction=False)
+            for cache, key, value in (
+                (self._etag, FEED_ETAG_KEY, etag),
+                (self._last_modified, FEED_LAST_MODIFIED_KEY, last_modified),
+            ):
+                if value:
+                    cache[feed_url] = value
+                    pipe.hset(key, feed_url, value)
+                else:
+                    cache.pop(feed_url, None)
+                    pipe.hdel(key, feed_url)
+            await pipe.execute()
+        except Exception as e:
+            print(f"Error storing feed cache validators for {feed_url}: {e}")
+    
+    async def fetch_all_feeds(self) -> List[Dict[str, Any]]:
+        """Fetch products from all configured RSS feeds concurrently."""
+        # Load before starting the feeds, so none of them goes out without its validators
+        await self._load_validators()
+        results = await asyncio.gather(
+            *[self.fetch_feed(feed_url) for feed_url in config.RSS_FEEDS],
+            return_exceptions=True
+        )
+        
+        all_products = []
+        for feed_url, products in zip(config.RSS_FEEDS, results):
+            if isinstance(products, Exception):
+                print(f"Error fetching RSS feed {feed_url}: {products}")
+                continue
             all_products.extend(products)
         
         return all_products
@@ -69,28 +238,18 @@ class RSSFetcher:
         """Generate unique ID for a product."""
         # Use link if available, otherwise use title
         unique_string = entry.get("link", "") or entry.get("title", "")
-        return hashlib.md5(unique_string.encode()).hexdigest()
+        # Non-cryptographic xxh3; the "x" prefix keeps these ids distinct from older md5 ids
+        return f"x{xxhash.xxh3_64_hexdigest(unique_string)}"
     
     def _extract_brand_from_feed(self, feed_url: str, entry: Dict[str, Any]) -> str:
         """Extract brand name from feed URL or entry."""
-        # Try to extract from feed URL
-        if "adidas" in feed_url.lower():
-            return "Adidas"
-        elif "hypebeast" in feed_url.lower():
-            return "HYPEBEAST"
-        elif "luxury" in feed_url.lower():
-            return "Luxury Brands"
-        
-        # Try to extract from entry title or description
-        title = entry.get("title", "").lower()
-        if "adidas" in title:
-            return "Adidas"
-        elif "nike" in title:
-            return "Nike"
-        elif "zara" in title:
-            return "Zara"
-        
-        return "Unknown Brand"
+        # Try the feed URL, precomputed for configured feeds
+        brand = _BRAND_BY_FEED[feed_url] if feed_url in _BRAND_BY_FEED else _brand_from_feed_url(feed_url)
+        if brand:
+            return brand
+        
+        # Try to extract from entry title
+        return _match_brand(_TITLE_BRAND_RE, _TITLE_BRANDS, entry.get("title", "")) or "Unknown Brand"
     
     def _extract_image(self, entry: Dict[str, Any]) -> str:
         """Extract image URL from RSS entry."""
@@ -114,8 +273,7 @@ class RSSFetcher:
         summary = entry.get("summary", entry.get("description", ""))
         if summary and "<img" in summary:
             # Simple extraction - in production, use proper HTML parsing
-            import re
-            img_match = re.search(r'<img[^>]+src=["\']([^"\']+)["\']', summary)
+            img_match = _IMG_RE.search(summary)
             if img_match:
                 return img_match.group(1)
         
@@ -127,20 +285,13 @@ class RSSFetcher:
             return ""
         
         # Remove HTML tags
-        text = re.sub(r'<[^>]+>', '', html_text)
+        text = _TAG_RE.sub('', html_text)
         
-        # Decode common HTML entities
-        text = text.replace('&nbsp;', ' ')
-        text = text.replace('&amp;', '&')
-        text = text.replace('&lt;', '<')
-        text = text.replace('&gt;', '>')
-        text = text.replace('&quot;', '"')
-        text = text.replace('&#39;', "'")
-        text = text.replace('&apos;', "'")
+        # Decode HTML entities
+        text = html.unescape(text)
         
         # Clean up extra whitespace
-        text = re.sub(r'\s+', ' ', text)
-        text = text.strip()
+        text = _WS_RE.sub(' ', text).strip()
         
         # Limit length to reasonable size
         if len(text) > 500:
@@ -152,7 +303,7 @@ class RSSFetcher:
         """Parse date string to ISO format."""
         try:
             if not date_string:
-                return datetime.now().isoformat()
+                return now_iso()
             
             # feedparser handles most date formats
             parsed = feedparser._parse_date(date_string)
@@ -161,7 +312,7 @@ class RSSFetcher:
         except:
             pass
         
-        return datetime.now().isoformat()
+        return now_iso()
 
 # Global fetcher instance
 rss_fetcher = RSSFetcher()
@@ -0,0 +1,148 @@
+"""Semantic cache for Agent Memory Server search results."""
+from typing import List, Dict, Any, Optional, Tuple
+import hashlib
+import logging
+import numpy as np
+import orjson
+from redis.commands.search.field import TagField, VectorField
+from redis.commands.search.indexDefinition import IndexDefinition, IndexType
+from redis.commands.search.query import Query
+from config import config
+from redis_connection import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Incremented whenever products are stored, so results cached before the write are never served
+PRODUCT_GENERATION_KEY = "fastfit:products:generation"
+
+class SemanticCache:
+    """Caches search results by query text and by query embedding similarity."""
+
+    def __init__(self):
+        """Initialize cache settings."""
+        self.prefix = f"{config.SEARCH_CACHE_INDEX_NAME}:"
+        self.ttl = config.SEARCH_CACHE_TTL_SECONDS
+        # RediSearch cosine distance is 1 - similarity
+        self.max_distance = 1.0 - config.SEARCH_CACHE_SIMILARITY_THRESHOLD
+        self._index_ready: Optional[bool] = None
+
+    @staticmethod
+    def _scope(user_id: str, limit: int, generation: int) -> str:
+        """Tag-safe scope so results are only shared between identical searches of the same product set."""
+        return hashlib.md5(f"{user_id}|{limit}|{generation}".encode()).hexdigest()
+
+    async def bump_generation(self):
+        """Invalidate every cached result after new products are stored."""
+        try:
+            await (await get_redis()).incr(PRODUCT_GENERATION_KEY)
+        except Exception as e:
+            logger.warning("Search cache invalidation failed: %s", e)
+
+    def _exact_key(self, scope: str, query: str) -> str:
+        return f"{self.prefix}exact:{scope}:{hashlib.md5(query.encode()).hexdigest()}"
+
+    async def _ensure_index(self) -> bool:
+        """Create the cache vector index once; disable vector lookups if RediSearch is unavailable."""
+        if self._index_ready is not None:
+            return self._index_ready
+        index = (await get_redis()).ft(config.SEARCH_CACHE_INDEX_NAME)
+        try:
+            await index.info()
+            self._index_ready = True
+        except Exception:
+            try:
+                await index.create_index(
+                    [
+                        TagField("scope"),
+                        VectorField("embedding", "HNSW", {
+                            "TYPE": "FLOAT32",
+                            "DIM": config.EMBEDDING_DIMENSION,
+                            "DISTANCE_METRIC": "COSINE",
+                        }),
+                    ],
+                    definition=IndexDefinition(prefix=[f"{self.prefix}vec:"], index_type=IndexType.HASH)
+                )
+                self._index_ready = True
+            except Exception as e:
+                logger.warning("Search cache vector index unavailable, using exact-match cache only: %s", e)
+                self._index_ready = False
+        return self._index_ready
+
+    async def get(
+        self,
+        query: str,
+        user_id: str,
+        limit: int
+    ) -> Tuple[Optional[List[Dict[str, Any]]], List[float], Optional[int]]:
+        """Return (cached memories or None, query embedding, product generation) for the exact or a similar query.
+
+        The query is only embedded when the exact-match lookup misses. The embedding and the
+        generation are returned so the caller can pass them back to set() on a miss; reusing
+        the generation read here keeps results fetched before a product write out of the newer
+        generation. The generation is None when the cache is unavailable.
+        """
+        embedding: List[float] = []
+        generation: Optional[int] = None
+        try:
+            redis = await get_redis()
+            generation = int(await redis.get(PRODUCT_GENERATION_KEY) or 0)
+            scope = self._scope(user_id, limit, generation)
+            cached = await redis.get(self._exact_key(scope, query))
+            if cached is not None:
+                return orjson.loads(cached), embedding, generation
+
+            if not await self._ensure_index():
+                return None, embedding, generation
+            # Only needed on an exact-match miss, so the OpenAI client is loaded lazily
+            from embeddings import embedding_service
+            embedding = await embedding_service.generate_embedding(query)
+            if not embedding:
+                return None, embedding, generation
+
+            knn = (
+                Query(f"(@scope:{{{scope}}})=>[KNN 1 @embedding $vec AS distance]")
+                .return_fields("results", "distance")
+                .sort_by("distance")
+                .dialect(2)
+            )
+            result = await redis.ft(config.SEARCH_CACHE_INDEX_NAME).search(
+                knn,
+                query_params={"vec": np.asarray(embedding, dtype=np.float32).tobytes()}
+            )
+            if result.docs and float(result.docs[0].distance) <= self.max_distance:
+                return orjson.loads(result.docs[0].results), embedding, generation
+        except Exception as e:
+            logger.warning("Search cache lookup failed: %s", e)
+        return None, embedding, generation
+
+    async def set(
+        self,
+        query: str,
+        user_id: str,
+        limit: int,
+        memories: List[Dict[str, Any]],
+        embedding: List[float],
+        generation: Optional[int]
+    ):
+        """Cache search results under the exact query and, if embedded, its vector, with TTL."""
+        if generation is None:
+            return
+        scope = self._scope(user_id, limit, generation)
+        try:
+            blob = orjson.dumps(memories)
+            pipe = (await get_redis()).pipeline(transaction=False)
+            pipe.set(self._exact_key(scope, query), blob, ex=self.ttl)
+            if embedding and await self._ensure_index():
+                vec_key = f"{self.prefix}vec:{scope}:{hashlib.md5(query.encode()).hexdigest()}"
+                pipe.hset(vec_key, mapping={
+                    "scope": scope,
+                    "results": blob,
+                    "embedding": np.asarray(embedding, dtype=np.float32).tobytes(),
+                })
+                pipe.expire(vec_key, self.ttl)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning("Search cache store failed: %s", e)
+
+# Global cache instance
+semantic_cache = SemanticCache()
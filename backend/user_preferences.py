@@ -1,141 +1,630 @@
 """User preference management and storage."""
 from typing import Dict, Any, List, Optional
+import asyncio
+import hashlib
+import logging
+import time
+import orjson
+from cachetools import LRUCache
 from agent_memory_client import agent_memory_client
-from embeddings import embedding_service
+from redis_connection import get_redis
 import numpy as np
 
+logger = logging.getLogger(__name__)
+
+# Preferences by email as (preferences, refresh_after), written through on every successful store.
+# Entries past refresh_after are still served while a background refresh replaces them.
+PREFS_CACHE_TTL_SECONDS = 60
+_PREFS_CACHE: LRUCache = LRUCache(maxsize=1024)
+# Per-email locks so concurrent cache misses share a single memory server lookup
+_PREFS_LOCKS: Dict[str, asyncio.Lock] = {}
+# In-flight background refreshes by email, so an expired entry is refreshed only once at a time
+_PREFS_REFRESHES: Dict[str, asyncio.Task] = {}
+
+# Feedback for the same user arriving within this window is merged into one update
+FEEDBACK_BATCH_MAX_WAIT_SECONDS = 0.075
+FEEDBACK_BATCH_MAX_SIZE = 100
+
+# Per-product feedback records are read back in pages of the search API maximum
+FEEDBACK_RECORDS_PAGE_SIZE = 100
+FEEDBACK_RECORDS_MAX = 5000
+
+# Most recent likes averaged into a taste profile
+TASTE_PROFILE_MAX_LIKES = 20
+# Redis hash per user: "profile" is the mean of liked product embeddings, int8-quantized
+# (see _quantize_profile), and "liked_ids" the JSON list of product ids it was built from, oldest first
+TASTE_PROFILE_KEY = "fastfit:taste:{email}"
+# Replaces a profile only if its liked ids are still the ones the update started from;
+# an empty new id list deletes the profile
+_TASTE_PROFILE_CAS_SCRIPT = """
+if (redis.call('HGET', KEYS[1], 'liked_ids') or '') ~= ARGV[1] then
+    return 0
+end
+if ARGV[2] == '' then
+    redis.call('DEL', KEYS[1])
+else
+    redis.call('HSET', KEYS[1], 'liked_ids', ARGV[2], 'profile', ARGV[3])
+end
+return 1
+"""
+TASTE_PROFILE_UPDATE_ATTEMPTS = 3
+# Last profile computed per user by this worker: (stored liked ids, liked id set, unnormalized mean, embedding count)
+_TASTE_PROFILE_CACHE: LRUCache = LRUCache(maxsize=1024)
+
+# Preference memory request bodies by email; the stable fields are built once per user
+_MEMORY_BODIES: LRUCache = LRUCache(maxsize=1024)
+
+# Digest of the preferences record last stored per user, shared by all workers
+PREFS_FINGERPRINT_KEY = "fastfit:prefs:fingerprint:{email}"
+# Expiry bounds how long stores are skipped if the memory server ever loses the record
+PREFS_FINGERPRINT_TTL_SECONDS = 60 * 60
+
+# Stored "key:value" entities that map back onto preference fields; the counts are only read
+# back by the feedback path, which adjusts them instead of reloading the history
+_ENTITY_FIELDS = {"notification_frequency": "notification_frequency"}
+_COUNT_ENTITIES = ("liked_count", "disliked_count")
+
+def _quantize_profile(profile: np.ndarray) -> bytes:
+    """Pack a profile as a float32 scale followed by int8 components (~4x smaller than float32)."""
+    scale = float(np.abs(profile).max()) / 127.0 or 1.0
+    quantized = np.round(profile / scale).astype(np.int8)
+    return np.float32(scale).tobytes() + quantized.tobytes()
+
+def _dequantize_profile(blob: bytes) -> np.ndarray:
+    """Unpack a profile packed by _quantize_profile back into float32."""
+    scale = np.frombuffer(blob[:4], dtype=np.float32)[0]
+    return np.frombuffer(blob[4:], dtype=np.int8).astype(np.float32) * scale
+
+def _cache_preferences(email: str, preferences: Dict[str, Any]):
+    """Cache preferences as fresh for PREFS_CACHE_TTL_SECONDS."""
+    _PREFS_CACHE[email] = (preferences, time.monotonic() + PREFS_CACHE_TTL_SECONDS)
+
+def _copy_preferences(preferences: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy with fresh lists, so callers mutating the result never touch the cached entry."""
+    return {key: list(value) if isinstance(value, list) else value for key, value in preferences.items()}
+
+def _apply_feedback_to_cache(email: str, changes: Dict[str, str]):
+    """Write stored feedback changes through to this worker's cached preferences, if cached."""
+    entry = _PREFS_CACHE.get(email)
+    if entry is None:
+        return
+    preferences, refresh_after = entry
+    preferences = _copy_preferences(preferences)
+    for product_id, state in changes.items():
+        for field in ("liked_product_ids", "disliked_product_ids"):
+            if product_id in preferences[field]:
+                preferences[field].remove(product_id)
+        preferences[f"{state}_product_ids"].append(product_id)
+    # A new entry, so an in-flight refresh that read before this write does not replace it
+    _PREFS_CACHE[email] = (preferences, refresh_after)
+
 class UserPreferences:
     """Manages user preferences and taste profiles."""
     
-    async def get_user_preferences(self, email: str) -> Dict[str, Any]:
-        """Get user preferences from memory."""
+    def __init__(self):
+        """Initialize the feedback batching state; the worker starts on first feedback."""
+        self._feedback_queue: Optional[asyncio.Queue] = None
+        self._feedback_worker: Optional[asyncio.Task] = None
+        # Latest background taste profile update per user; each one waits for the previous
+        self._profile_updates: Dict[str, asyncio.Task] = {}
+    
+    async def get_user_preferences(self, email: str, fresh: bool = False) -> Dict[str, Any]:
+        """Get user preferences, from the in-process cache when possible.
+        
+        Expired entries are returned as-is while a background task fetches a fresh copy,
+        so only the first lookup for an email waits on the memory server.
+        
+        The cache is per worker and may miss another worker's store, so read-modify-write
+        callers pass fresh=True: the memory server is always queried and a failed lookup
+        raises instead of returning defaults that would then be stored back.
+        """
+        if fresh:
+            preferences = await self._fetch_user_preferences(email)
+            _cache_preferences(email, preferences)
+            return _copy_preferences(preferences)
+        
+        entry = _PREFS_CACHE.get(email)
+        if entry is not None:
+            cached, refresh_after = entry
+            if time.monotonic() >= refresh_after and email not in _PREFS_REFRESHES:
+                task = asyncio.create_task(self._refresh_user_preferences(email, entry))
+                _PREFS_REFRESHES[email] = task
+                task.add_done_callback(lambda _: _PREFS_REFRESHES.pop(email, None))
+        else:
+            lock = _PREFS_LOCKS.setdefault(email, asyncio.Lock())
+            try:
+                async with lock:
+                    # Another request may have filled the cache while we waited
+                    entry = _PREFS_CACHE.get(email)
+                    if entry is not None:
+                        cached = entry[0]
+                    else:
+                        cached = await self._fetch_user_preferences(email)
+                        _cache_preferences(email, cached)
+            except Exception as e:
+                # Nothing is cached, so the next call retries the lookup
+                logger.error("Error getting user preferences for %s: %s", email, e)
+                return self._get_default_preferences(email)
+            finally:
+                if not lock.locked():
+                    _PREFS_LOCKS.pop(email, None)
+        
+        return _copy_preferences(cached)
+    
+    async def _refresh_user_preferences(self, email: str, stale_entry: tuple):
+        """Replace an expired cache entry unless a store has written through in the meantime."""
         try:
-            # Search for user preferences in memory
-            memories = await agent_memory_client.search_memories(
-                query=f"user preferences email {email}",
-                limit=10,
-                user_id_filter=email
-            )
-            
-            if memories:
-                # Extract preference data from memory
-                for memory in memories:
-                    if memory.get("id") == f"user_{email}":
-                        return self._parse_preference_memory(memory)
-            
-            # Return default preferences if not found
-            return self._get_default_preferences(email)
+            preferences = await self._fetch_user_preferences(email)
+        except Exception as e:
+            # Keep serving the stale entry; the next read schedules another attempt
+            logger.error("Error refreshing user preferences for %s: %s", email, e)
+            return
+        if _PREFS_CACHE.get(email) is stale_entry:
+            _cache_preferences(email, preferences)
+    
+    async def _fetch_user_preferences(self, email: str) -> Dict[str, Any]:
+        """Load user preferences from memory, falling back to defaults if none are stored.
+        
+        Raises if the memory server lookup fails, so a failure is never mistaken for a new user.
+        """
+        # Search for user preferences and per-product feedback records in memory
+        record, feedback_records = await asyncio.gather(
+            self._fetch_preference_record(email),
+            self._fetch_feedback_records(email)
+        )
         
+        # Extract preference data from memory, or use defaults if not found
+        preferences = self._parse_preference_memory(record) if record else self._get_default_preferences(email)
+        
+        # Search results come back by relevance; restore oldest-to-newest feedback order,
+        # the same order feedback is appended in while applying a batch
+        record_prefix = f"user_{email}_feedback_"
+        feedback = []
+        for record in feedback_records:
+            record_id = record.get("id", "")
+            if not record_id.startswith(record_prefix):
+                continue
+            updated_at = 0.0
+            for entity in record.get("entities", []):
+                key, _, value = entity.partition(":")
+                if key == "updated_at":
+                    try:
+                        updated_at = float(value)
+                    except ValueError:
+                        pass
+            feedback.append((updated_at, record_id[len(record_prefix):], record.get("topics") or []))
+        
+        for _, product_id, topics in sorted(feedback, key=lambda item: item[0]):
+            if "liked" in topics:
+                preferences["liked_product_ids"].append(product_id)
+            elif "disliked" in topics:
+                preferences["disliked_product_ids"].append(product_id)
+        
+        return preferences
+    
+    async def _fetch_preference_record(self, email: str) -> Optional[Dict[str, Any]]:
+        """Load the user's preferences record, or None if none is stored; raises if the lookup fails."""
+        # The preferences record is the user's only semantic memory (feedback records are episodic),
+        # so filtering on the type keeps a long feedback history from pushing it out of the results
+        memories = await agent_memory_client.search_memories(
+            query=f"user preferences email {email}",
+            limit=10,
+            user_id_filter=email,
+            memory_type_filter="semantic",
+            raise_on_error=True
+        )
+        return next((memory for memory in memories if memory.get("id") == f"user_{email}"), None)
+    
+    async def _fetch_feedback_states(self, email: str, product_ids: List[str]) -> Dict[str, str]:
+        """Load the "liked"/"disliked" state of just these products; products without feedback are left out.
+        
+        Takes at most 100 ids (the search API maximum), which FEEDBACK_BATCH_MAX_SIZE guarantees.
+        """
+        records = await agent_memory_client.search_memories(
+            query=f"product feedback from {email}",
+            limit=len(product_ids),
+            user_id_filter=email,
+            topics_filter=["liked", "disliked"],
+            entities_filter=[f"product_id:{product_id}" for product_id in product_ids],
+            raise_on_error=True
+        )
+        
+        record_prefix = f"user_{email}_feedback_"
+        wanted = set(product_ids)
+        states = {}
+        for record in records:
+            record_id = record.get("id", "")
+            product_id = record_id[len(record_prefix):]
+            if not record_id.startswith(record_prefix) or product_id not in wanted:
+                continue
+            topics = record.get("topics") or []
+            if "liked" in topics:
+                states[product_id] = "liked"
+            elif "disliked" in topics:
+                states[product_id] = "disliked"
+        return states
+    
+    async def _fetch_feedback_records(self, email: str) -> List[Dict[str, Any]]:
+        """Page through a user's feedback records, up to FEEDBACK_RECORDS_MAX."""
+        records: List[Dict[str, Any]] = []
+        while len(records) < FEEDBACK_RECORDS_MAX:
+            page = await agent_memory_client.search_memories(
+                query=f"product feedback from {email}",
+                limit=FEEDBACK_RECORDS_PAGE_SIZE,
+                user_id_filter=email,
+                topics_filter=["liked", "disliked"],
+                offset=len(records),
+                raise_on_error=True
+            )
+            records.extend(page)
+            if len(page) < FEEDBACK_RECORDS_PAGE_SIZE:
+                break
+        return records
+    
+    async def _store_feedback_records(self, email: str, changes: Dict[str, str]) -> bool:
+        """Upsert one small memory per changed product, so a write never carries the whole history."""
+        updated_at = f"{time.time():.3f}"
+        memories = [
+            {
+                "id": f"user_{email}_feedback_{product_id}",
+                "text": f"{email} {state} product {product_id}",
+                "user_id": email,
+                "memory_type": "episodic",
+                "topics": [state],
+                "entities": [f"product_id:{product_id}", f"updated_at:{updated_at}"]
+            }
+            for product_id, state in changes.items()
+        ]
+        try:
+            # Ids are the upsert keys; semantic deduplication could merge the near-identical
+            # texts of different products' records and drop likes
+            response = await agent_memory_client.post_json(
+                "/v1/long-term-memory/",
+                {"memories": memories, "deduplicate": False}
+            )
+            response.raise_for_status()
+            return True
         except Exception as e:
-            print(f"Error getting user preferences for {email}: {e}")
-            return self._get_default_preferences(email)
+            logger.error("Error storing feedback records for %s: %s", email, e)
+            return False
     
     async def store_user_preferences(self, email: str, preferences: Dict[str, Any]) -> bool:
-        """Store user preferences in memory."""
+        """Store user preferences in memory, skipping the write if they match the last store."""
+        try:
+            normalized = {**self._get_default_preferences(email), **preferences}
+            liked_count = len(normalized["liked_product_ids"])
+            disliked_count = len(normalized["disliked_product_ids"])
+        except Exception as e:
+            logger.error("Error storing user preferences for %s: %s", email, e)
+            return False
+        
+        if not await self._store_preference_record(
+            email,
+            normalized["notification_frequency"],
+            normalized["preferred_brands"],
+            liked_count,
+            disliked_count
+        ):
+            return False
+        _cache_preferences(email, _copy_preferences(normalized))
+        return True
+    
+    async def _store_preference_record(
+        self,
+        email: str,
+        frequency: str,
+        brands: List[str],
+        liked_count: int,
+        disliked_count: int
+    ) -> bool:
+        """Write the user's preferences record, skipping the write if it matches the last store."""
         try:
-            text = f"User preferences for {email}. Notification frequency: {preferences.get('notification_frequency', 'weekly')}. Preferred brands: {', '.join(preferences.get('preferred_brands', []))}"
+            fingerprint = hashlib.blake2b(
+                orjson.dumps([frequency, brands, liked_count, disliked_count]), digest_size=8
+            ).digest()
+            if await self._stored_fingerprint(email) == fingerprint:
+                return True
+            # Cleared while the write is in flight, so a store from another worker meanwhile never
+            # matches the previous record's fingerprint and skips itself as a duplicate
+            await self._forget_fingerprint(email)
             
-            memory_data = {
-                "id": f"user_{email}",
-                "text": text,
-                "user_id": email,  # Use email as user_id for user-specific memories
-                "memory_type": "semantic",
-                "topics": preferences.get("preferred_brands", []),
-                "entities": [
-                    f"notification_frequency:{preferences.get('notification_frequency', 'weekly')}",
-                    f"liked_count:{len(preferences.get('liked_product_ids', []))}",
-                    f"disliked_count:{len(preferences.get('disliked_product_ids', []))}"
-                ]
-            }
+            text = f"User preferences for {email}. Notification frequency: {frequency}."
+            if brands:
+                text = f"{text} Preferred brands: {', '.join(brands)}"
             
-            response = await agent_memory_client.client.post(
-                "/v1/long-term-memory/",
-                json={"memories": [memory_data], "deduplicate": True}
-            )
+            # Reuse this user's request body; only the per-store fields change. post_json
+            # serializes it before yielding, so concurrent stores never see a half-updated body.
+            body = _MEMORY_BODIES.get(email)
+            if body is None:
+                body = {
+                    "memories": [{
+                        "id": f"user_{email}",
+                        "user_id": email,  # Use email as user_id for user-specific memories
+                        "memory_type": "semantic",
+                    }],
+                    # The id is the upsert key; semantic deduplication could merge this record
+                    # into one of the user's similar-looking feedback records
+                    "deduplicate": False
+                }
+                _MEMORY_BODIES[email] = body
+            memory_data = body["memories"][0]
+            memory_data["text"] = text
+            memory_data["topics"] = brands
+            memory_data["entities"] = [
+                f"notification_frequency:{frequency}",
+                f"liked_count:{liked_count}",
+                f"disliked_count:{disliked_count}"
+            ]
+            
+            response = await agent_memory_client.post_json("/v1/long-term-memory/", body)
             response.raise_for_status()
+            await self._remember_fingerprint(email, fingerprint)
             return True
         
         except Exception as e:
-            print(f"Error storing user preferences for {email}: {e}")
+            logger.error("Error storing user preferences for %s: %s", email, e)
             return False
     
+    async def _stored_fingerprint(self, email: str) -> Optional[bytes]:
+        """Fingerprint of the preferences last stored for this user by any worker, if known."""
+        try:
+            redis = await get_redis()
+            return await redis.get(PREFS_FINGERPRINT_KEY.format(email=email))
+        except Exception as e:
+            logger.warning("Error reading preferences fingerprint for %s: %s", email, e)
+            return None
+    
+    async def _remember_fingerprint(self, email: str, fingerprint: bytes):
+        """Record the fingerprint of a successful store."""
+        try:
+            redis = await get_redis()
+            await redis.set(
+                PREFS_FINGERPRINT_KEY.format(email=email), fingerprint, ex=PREFS_FINGERPRINT_TTL_SECONDS
+            )
+        except Exception as e:
+            logger.warning("Error storing preferences fingerprint for %s: %s", email, e)
+    
+    async def _forget_fingerprint(self, email: str):
+        """Drop the fingerprint before a write replaces the record it describes."""
+        try:
+            redis = await get_redis()
+            await redis.delete(PREFS_FINGERPRINT_KEY.format(email=email))
+        except Exception as e:
+            logger.warning("Error clearing preferences fingerprint for %s: %s", email, e)
+    
     async def update_preferences_from_feedback(
         self, 
         email: str, 
         product_id: str, 
         feedback: str  # "good" or "bad"
     ) -> bool:
-        """Update user preferences based on feedback."""
-        try:
-            preferences = await self.get_user_preferences(email)
+        """Update user preferences based on feedback.
+        
+        Feedback is queued and merged with other feedback for the same user that arrives
+        within FEEDBACK_BATCH_MAX_WAIT_SECONDS, so a burst of clicks costs one read and one write.
+        Returns once the batch containing this feedback has been stored.
+        """
+        loop = asyncio.get_running_loop()
+        # The queue and worker belong to the loop that created them
+        if self._feedback_worker is None or self._feedback_worker.done() or self._feedback_worker.get_loop() is not loop:
+            self._feedback_queue = asyncio.Queue()
+            self._feedback_worker = asyncio.create_task(self._feedback_batch_loop(self._feedback_queue))
+        
+        stored = loop.create_future()
+        self._feedback_queue.put_nowait((email, product_id, feedback, stored))
+        return await stored
+    
+    async def _feedback_batch_loop(self, queue: asyncio.Queue):
+        """Drain queued feedback in batches and apply each user's share with a single store."""
+        while True:
+            batch = [await queue.get()]
+            # Give the rest of a burst a moment to arrive before flushing
+            await asyncio.sleep(FEEDBACK_BATCH_MAX_WAIT_SECONDS)
+            while len(batch) < FEEDBACK_BATCH_MAX_SIZE and not queue.empty():
+                batch.append(queue.get_nowait())
             
-            if feedback == "good":
-                if product_id not in preferences.get("liked_product_ids", []):
-                    preferences.setdefault("liked_product_ids", []).append(product_id)
-                # Remove from disliked if present
-                if product_id in preferences.get("disliked_product_ids", []):
-                    preferences["disliked_product_ids"].remove(product_id)
-            elif feedback == "bad":
-                if product_id not in preferences.get("disliked_product_ids", []):
-                    preferences.setdefault("disliked_product_ids", []).append(product_id)
-                # Remove from liked if present
-                if product_id in preferences.get("liked_product_ids", []):
-                    preferences["liked_product_ids"].remove(product_id)
+            by_email: Dict[str, List[tuple]] = {}
+            for item in batch:
+                by_email.setdefault(item[0], []).append(item)
+            await asyncio.gather(*[
+                self._apply_feedback_batch(email, items) for email, items in by_email.items()
+            ])
+    
+    async def _apply_feedback_batch(self, email: str, items: List[tuple]):
+        """Apply a user's queued feedback in arrival order, store once and resolve each caller.
+        
+        Only the touched products' feedback records are read, and the like/dislike counts on the
+        preferences record are adjusted by the changes, so the cost never grows with the history.
+        """
+        try:
+            touched = list(dict.fromkeys(item[1] for item in items))
+            record, before = await asyncio.gather(
+                self._fetch_preference_record(email),
+                self._fetch_feedback_states(email, touched)
+            )
             
-            # Rebuild taste profile from liked products
-            await self._rebuild_taste_profile(email, preferences)
+            states = dict(before)
+            for _, product_id, feedback, _ in items:
+                if feedback == "good":
+                    states[product_id] = "liked"
+                elif feedback == "bad":
+                    states[product_id] = "disliked"
             
-            # Store updated preferences
-            return await self.store_user_preferences(email, preferences)
+            # Persist only products whose like/dislike state actually changed
+            changes = {pid: state for pid, state in states.items() if state != before.get(pid)}
+            if not changes:
+                success = True
+            elif not await self._store_feedback_records(email, changes):
+                success = False
+            else:
+                counts = self._stored_counts(record)
+                for pid, state in changes.items():
+                    if pid in before:
+                        counts[before[pid]] -= 1
+                    counts[state] += 1
+                
+                preferences = self._parse_preference_memory(record) if record else self._get_default_preferences(email)
+                success = await self._store_preference_record(
+                    email,
+                    preferences["notification_frequency"],
+                    preferences["preferred_brands"],
+                    max(counts["liked"], 0),
+                    max(counts["disliked"], 0)
+                )
+                # The feedback records are the source of truth and are stored either way
+                _apply_feedback_to_cache(email, changes)
+                # Update the taste profile without holding up the caller
+                self._schedule_taste_profile_update(email, changes)
         
         except Exception as e:
-            print(f"Error updating preferences from feedback: {e}")
-            return False
+            logger.error("Error updating preferences from feedback for %s: %s", email, e)
+            success = False
+        
+        for *_, stored in items:
+            if not stored.done():
+                stored.set_result(success)
     
-    async def _rebuild_taste_profile(self, email: str, preferences: Dict[str, Any]):
-        """Rebuild taste profile embedding from liked products."""
-        try:
-            liked_ids = preferences.get("liked_product_ids", [])
-            if not liked_ids:
-                return
-            
-            # Get embeddings for liked products
-            product_embeddings = []
-            for product_id in liked_ids[:20]:  # Limit to 20 most recent
-                # Search for product in memory
-                memories = await agent_memory_client.search_memories(
-                    query=f"product {product_id}",
-                    limit=1
-                )
-                if memories:
-                    # Extract embedding if available (would need to store separately)
-                    # For now, we'll use the product text to build profile
+    @staticmethod
+    def _stored_counts(record: Optional[Dict[str, Any]]) -> Dict[str, int]:
+        """Like/dislike counts stored on a preferences record, keyed by feedback state."""
+        counts = {"liked": 0, "disliked": 0}
+        for entity in (record or {}).get("entities", []):
+            key, _, value = entity.partition(":")
+            if key in _COUNT_ENTITIES:
+                try:
+                    counts[key[:-len("_count")]] = int(value)
+                except ValueError:
                     pass
+        return counts
+    
+    def _schedule_taste_profile_update(self, email: str, changes: Dict[str, str]):
+        """Update a user's taste profile in the background, after any update already queued for them."""
+        previous = self._profile_updates.get(email)
+        task = asyncio.create_task(self._update_after(previous, email, dict(changes)))
+        self._profile_updates[email] = task
+        
+        def _forget(done: asyncio.Task):
+            if self._profile_updates.get(email) is done:
+                del self._profile_updates[email]
+        
+        task.add_done_callback(_forget)
+    
+    async def _update_after(self, previous: Optional[asyncio.Task], email: str, changes: Dict[str, str]):
+        """Serialize updates per user so incremental updates never start from a stale memo."""
+        if previous is not None:
+            await asyncio.wait([previous])
+        await self._update_taste_profile(email, changes)
+    
+    async def _update_taste_profile(self, email: str, changes: Dict[str, str]):
+        """Fold one batch of like/dislike changes into the user's taste profile.
+        
+        The profile keeps its own list of the TASTE_PROFILE_MAX_LIKES most recent liked ids, which
+        the changes update, so the feedback history is never reloaded. The write is a compare-and-set
+        on that list, retried if another worker updated the profile in the meantime.
+        """
+        try:
+            redis = await get_redis()
+            key = TASTE_PROFILE_KEY.format(email=email)
+            for _ in range(TASTE_PROFILE_UPDATE_ATTEMPTS):
+                stored_ids = await redis.hget(key, "liked_ids") or b""
+                liked = dict.fromkeys(orjson.loads(stored_ids) if stored_ids else [])
+                for product_id, state in changes.items():
+                    liked.pop(product_id, None)
+                    if state == "liked":
+                        liked[product_id] = None  # Most recent last
+                liked_ids = list(liked)[-TASTE_PROFILE_MAX_LIKES:]
+                new_ids = orjson.dumps(liked_ids) if liked_ids else b""
+                if new_ids == stored_ids:
+                    # Same liked products as the stored profile
+                    return
+                
+                profile = b""
+                memo = None
+                if liked_ids:
+                    liked_set = frozenset(liked_ids)
+                    # The memo is only a valid starting point while it still describes the stored profile
+                    cached = _TASTE_PROFILE_CACHE.get(email)
+                    if cached and cached[0] != stored_ids:
+                        cached = None
+                    added = liked_set - cached[1] if cached and cached[1] <= liked_set else None
+                    if added and len(added) == 1:
+                        # One new like: fold its embedding into the running mean in O(D)
+                        embeddings = await self._embed_liked_products(list(added))
+                        if not embeddings:
+                            return
+                        _, _, mean, count = cached
+                        mean = (mean * count + embeddings[0]) / (count + 1)
+                        count += 1
+                    else:
+                        embeddings = await self._embed_liked_products(liked_ids)
+                        if not embeddings:
+                            return
+                        # Average in a single (N, D) reduction
+                        mean = np.stack(embeddings).mean(axis=0)
+                        count = len(embeddings)
+                    
+                    # L2-normalize so the profile is ready for cosine scoring
+                    norm = np.linalg.norm(mean)
+                    profile = _quantize_profile(mean / norm if norm else mean)
+                    memo = (new_ids, liked_set, mean, count)
+                
+                if await redis.eval(_TASTE_PROFILE_CAS_SCRIPT, 1, key, stored_ids, new_ids, profile):
+                    # Remember the profile only once it is stored, so a failed write is retried next time
+                    if memo:
+                        _TASTE_PROFILE_CACHE[email] = memo
+                    else:
+                        _TASTE_PROFILE_CACHE.pop(email, None)
+                    return
             
-            # For POC: we'll build taste profile by averaging liked product embeddings
-            # This would require storing product embeddings separately
-            # For now, we'll use semantic search on liked product IDs
-            
+            logger.warning("Taste profile for %s kept changing concurrently, update dropped", email)
+        
         except Exception as e:
-            print(f"Error rebuilding taste profile: {e}")
+            logger.error("Error updating taste profile for %s: %s", email, e)
     
-    def _parse_preference_memory(self, memory: Dict[str, Any]) -> Dict[str, Any]:
-        """Parse preference data from memory."""
-        entities = memory.get("entities", [])
-        topics = memory.get("topics", [])
+    async def _embed_liked_products(self, product_ids: List[str]) -> List[np.ndarray]:
+        """Embeddings of the given products that are stored in memory, in input order."""
+        # Imported here so preference reads never load the OpenAI client
+        from embeddings import embedding_service
+        embeddings = await embedding_service.get_product_embeddings(product_ids)
         
-        notification_frequency = "weekly"
-        for entity in entities:
-            if entity.startswith("notification_frequency:"):
-                notification_frequency = entity.split(":")[1]
+        # Memory search results carry no vectors, so only products never embedded before
+        # are looked up by id and embedded, in one request
+        missing = [pid for pid in product_ids if pid not in embeddings]
+        if missing:
+            memories = await agent_memory_client.get_product_memories(missing)
+            texts = {pid: memory["text"] for pid, memory in memories.items() if memory.get("text")}
+            embeddings.update(await embedding_service.embed_products(texts))
         
-        return {
+        return [embeddings[pid] for pid in product_ids if pid in embeddings]
+    
+    async def get_taste_profile(self, email: str) -> Optional[np.ndarray]:
+        """Get the user's L2-normalized taste profile as float32, or None if none has been built."""
+        try:
+            redis = await get_redis()
+            blob = await redis.hget(TASTE_PROFILE_KEY.format(email=email), "profile")
+        except Exception as e:
+            logger.error("Error getting taste profile for %s: %s", email, e)
+            return None
+        return _dequantize_profile(blob) if blob else None
+    
+    def _parse_preference_memory(self, memory: Dict[str, Any]) -> Dict[str, Any]:
+        """Parse preference data from memory."""
+        preferences = {
             "email": memory.get("id", "").replace("user_", ""),
-            "notification_frequency": notification_frequency,
-            "preferred_brands": topics or [],
-            "liked_product_ids": [],  # Would need separate storage for this
-            "disliked_product_ids": [],  # Would need separate storage for this
+            "notification_frequency": "weekly",
+            "preferred_brands": memory.get("topics") or [],
+            "liked_product_ids": [],  # Filled from per-product feedback records
+            "disliked_product_ids": [],  # Filled from per-product feedback records
         }
+        
+        # One partition per "key:value" entity, dispatched through the field table
+        for entity in memory.get("entities", []):
+            key, _, value = entity.partition(":")
+            field = _ENTITY_FIELDS.get(key)
+            if field:
+                preferences[field] = value
+        
+        return preferences
     
     def _get_default_preferences(self, email: str) -> Dict[str, Any]:
         """Get default preferences for a new user."""